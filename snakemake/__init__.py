@@ -17,6 +17,7 @@ import webbrowser
 from functools import partial
 
 from snakemake.workflow import Workflow
+from snakemake.dag import DAG
 from snakemake.exceptions import print_exception
 from snakemake.logging import setup_logger, logger
 from snakemake.version import __version__
@@ -102,7 +103,12 @@ def snakemake(snakefile,
               force_use_threads=False,
               use_conda=False,
               mode=Mode.default,
-              wrapper_prefix=None):
+              wrapper_prefix=None,
+              cache_dag=False,
+              prefetch_threads=8,
+              input_function_threads=0,
+              critical_path=False,
+              max_dependency_depth=DAG.MAX_DEPENDENCY_DEPTH):
     """Run snakemake on a given snakefile.
 
     This function provides access to the whole snakemake functionality. It is not thread-safe.
@@ -179,6 +185,11 @@ def snakemake(snakefile,
         use_conda (bool):           create conda environments for each job (defined with conda directive of rules)
         mode (snakemake.common.Mode): Execution mode
         wrapper_prefix (str):       Prefix for wrapper script URLs (default None)
+        cache_dag (bool):           cache the inferred DAG in the .snakemake directory and reuse it in subsequent invocations if Snakefiles, config, rules and targets are unchanged (default False)
+        prefetch_threads (int):     number of threads used to fetch the metadata of all files in the DAG before determining which jobs need to run, 0 to disable prefetching (default 8)
+        input_function_threads (int): number of threads used to evaluate the input functions of the candidate jobs for the input files of a job concurrently while building the DAG, 0 to evaluate them serially (default 0)
+        critical_path (bool):       prioritize jobs by the estimated runtime of the longest path of jobs starting with them, based on the runtimes recorded in the .snakemake directory (default False)
+        max_dependency_depth (int): maximum length of a chain of dependencies, longer chains are considered to be caused by a rule that generates its own input (default 150000)
         log_handler (function):     redirect snakemake output to this custom log handler, a function that takes a log message dictionary (see below) as its only argument (default None). The log message dictionary for the log handler has to following entries:
 
             :level:
@@ -377,7 +388,12 @@ def snakemake(snakefile,
                                        keep_logger=True,
                                        keep_shadow=True,
                                        force_use_threads=use_threads,
-                                       use_conda=use_conda)
+                                       use_conda=use_conda,
+                                       cache_dag=cache_dag,
+                                       prefetch_threads=prefetch_threads,
+                                       input_function_threads=input_function_threads,
+                                       critical_path=critical_path,
+                                       max_dependency_depth=max_dependency_depth)
                 success = workflow.execute(
                     targets=targets,
                     dryrun=dryrun,
@@ -432,7 +448,12 @@ def snakemake(snakefile,
                     allowed_rules=allowed_rules,
                     greediness=greediness,
                     no_hooks=no_hooks,
-                    force_use_threads=use_threads)
+                    force_use_threads=use_threads,
+                    cache_dag=cache_dag,
+                    prefetch_threads=prefetch_threads,
+                    input_function_threads=input_function_threads,
+                    critical_path=critical_path,
+                    max_dependency_depth=max_dependency_depth)
 
     except BrokenPipeError:
         # ignore this exception and stop. It occurs if snakemake output is piped into less and less quits before reading the whole output.
@@ -602,6 +623,56 @@ def get_argument_parser():
         help="Do not execute anything and print the directed "
         "acyclic graph of jobs in the dot language. Recommended "
         "use on Unix systems: snakemake --dag | dot | display")
+    parser.add_argument(
+        "--cache-dag",
+        action="store_true",
+        help="Cache the inferred DAG of jobs in the .snakemake directory "
+        "and reuse it in subsequent invocations with the same targets. "
+        "The cache is invalidated if Snakefiles, config or rules change, "
+        "if input or output files of a cached job change, if an input "
+        "file that is not produced by the workflow is missing, or if a "
+        "file whose absence determined the DAG has been created. "
+        "Input functions are still evaluated for all cached jobs.")
+    parser.add_argument(
+        "--prefetch-threads",
+        default=8,
+        type=int,
+        metavar="N",
+        help="Number of threads used to fetch the metadata (existence, "
+        "modification time) of all files in the DAG before determining "
+        "which jobs need to run. Higher values can considerably speed up "
+        "DAG evaluation on network filesystems. Set to 0 to disable "
+        "prefetching (default 8).")
+    parser.add_argument(
+        "--input-function-threads",
+        default=0,
+        type=int,
+        metavar="N",
+        help="Number of threads used to evaluate the input functions of the "
+        "candidate jobs for the input files of a job concurrently while "
+        "building the DAG. This can speed up DAG evaluation if input "
+        "functions perform I/O, e.g. database lookups. The functions must be "
+        "thread-safe. The resulting DAG does not depend on this setting "
+        "(default 0, i.e. evaluate serially).")
+    parser.add_argument(
+        "--critical-path",
+        action="store_true",
+        help="Prioritize jobs by the estimated runtime of the longest path of "
+        "jobs starting with them (the critical path), such that long chains "
+        "of jobs are started early. Runtimes of the jobs of each rule are "
+        "recorded in the .snakemake directory by every run; rules without "
+        "recorded runtimes are assumed to take the average runtime. Explicit "
+        "priorities (see --prioritize and the priority directive) still take "
+        "precedence.")
+    parser.add_argument(
+        "--max-dependency-depth",
+        default=DAG.MAX_DEPENDENCY_DEPTH,
+        type=int,
+        metavar="N",
+        help="Maximum length of a chain of dependencies. Longer chains are "
+        "considered to be caused by a rule that generates its own input, "
+        "which is reported as an error (default {}).".format(
+            DAG.MAX_DEPENDENCY_DEPTH))
     parser.add_argument(
         "--force-use-threads",
         dest="force_use_threads",
@@ -794,7 +865,9 @@ def get_argument_parser():
         "--stats",
         metavar="FILE",
         help=
-        "Write stats about Snakefile execution in JSON format to the given file.")
+        "Write stats about Snakefile execution in JSON format to the given file. "
+        "Besides runtimes, this contains a histogram of the latency between "
+        "a job finishing and the next job being started.")
     parser.add_argument("--nocolor",
                         action="store_true",
                         help="Do not use a colored output.")
@@ -1117,7 +1190,12 @@ def main(argv=None):
                             force_use_threads=args.force_use_threads,
                             use_conda=args.use_conda,
                             mode=args.mode,
-                            wrapper_prefix=args.wrapper_prefix)
+                            wrapper_prefix=args.wrapper_prefix,
+                            cache_dag=args.cache_dag,
+                            prefetch_threads=args.prefetch_threads,
+                            input_function_threads=args.input_function_threads,
+                            critical_path=args.critical_path,
+                            max_dependency_depth=args.max_dependency_depth)
 
     if args.profile:
         with open(args.profile, "w") as out:
@@ -4,19 +4,22 @@ __email__ = "koester@jimmy.harvard.edu"
 __license__ = "MIT"
 
 import os
+import json
+import hashlib
 import shutil
 import textwrap
 import time
 import tarfile
-from collections import defaultdict, Counter
+from collections import defaultdict, Counter, deque
 from itertools import chain, combinations, filterfalse, product, groupby
 from functools import partial, lru_cache
 from inspect import isfunction, ismethod
 from operator import itemgetter, attrgetter
 from pathlib import Path
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
-from snakemake.io import IOFile, _IOFile, PeriodicityDetector, wait_for_files, is_flagged, contains_wildcard
+from snakemake.io import IOFile, _IOFile, PeriodicityDetector, wait_for_files, is_flagged, is_callable, contains_wildcard, iocache
 from snakemake.jobs import Job, Reason
 from snakemake.exceptions import RuleException, MissingInputException
 from snakemake.exceptions import MissingRuleException, AmbiguousRuleException
@@ -26,18 +29,37 @@ from snakemake.exceptions import PeriodicWildcardError
 from snakemake.exceptions import RemoteFileException, WorkflowError
 from snakemake.exceptions import UnexpectedOutputException, InputFunctionException
 from snakemake.logging import logger
+from snakemake.persistence import MAX_RECORDED_INPUT_FILES
 from snakemake.output_index import OutputIndex
+from snakemake.jobgraph import JobGraph
 from snakemake.common import DYNAMIC_FILL
 from snakemake import conda
+from snakemake.version import __version__
+
+class _Failure:
+    """A failed attempt to add a job to the DAG. Most failures just discard
+    a candidate job, hence the exception is only created when the failure is
+    reported."""
+
+    __slots__ = ["exception_type", "args", "kwargs"]
+
+    def __init__(self, exception_type, *args, **kwargs):
+        self.exception_type = exception_type
+        self.args = args
+        self.kwargs = kwargs
+
+    def exception(self):
+        return self.exception_type(*self.args, **self.kwargs)
 
-# Workaround for Py <3.5 prior to existence of RecursionError
-try:
-    RecursionError
-except NameError:
-    RecursionError = RuntimeError
 
 class DAG:
     """Directed acyclic graph of jobs."""
+
+    # up to this number of jobs to run, downstream sizes are always exact
+    EXACT_DOWNSTREAM_SIZE_MAX_JOBS = 10000
+    # longer chains of dependencies are considered to be infinite
+    MAX_DEPENDENCY_DEPTH = 150000
+
     def __init__(self,
                  workflow,
                  rules=None,
@@ -57,15 +79,22 @@ class DAG:
                  force_incomplete=False,
                  ignore_incomplete=False,
                  notemp=False,
-                 keep_remote_local=False):
+                 keep_remote_local=False,
+                 cache_dag=False,
+                 prefetch_threads=8,
+                 input_function_threads=0,
+                 max_dependency_depth=MAX_DEPENDENCY_DEPTH):
 
         self.dryrun = dryrun
-        self.dependencies = defaultdict(partial(defaultdict, set))
-        self.depending = defaultdict(partial(defaultdict, set))
+        self._graph = JobGraph()
         self._needrun = set()
         self._priority = dict()
         self._downstream_size = dict()
+        self._critical_path = dict()
         self._temp_input_count = dict()
+        # estimated runtime of each rule (by name) if jobs shall be
+        # prioritized by their critical path
+        self.runtimes = None
         self._reason = defaultdict(Reason)
         self._finished = set()
         self._dynamic = set()
@@ -80,10 +109,25 @@ class DAG:
         self.targetjobs = set()
         self.prioritytargetjobs = set()
         self._ready_jobs = set()
+        # number of unfinished needrun dependencies of each unfinished
+        # needrun job
+        self._n_unfinished_deps = dict()
         self.notemp = notemp
         self.keep_remote_local = keep_remote_local
         self._jobid = dict()
         self.job_cache = dict()
+        self.cache_dag = cache_dag
+        self.prefetch_threads = prefetch_threads
+        self.input_function_threads = input_function_threads
+        self.max_dependency_depth = max_dependency_depth
+        self._input_function_pool = None
+        # files whose absence made a candidate job fail during DAG inference
+        self._missing_candidate_input = set()
+        # input files of rules that no rule can produce
+        self._unproducible_input = dict()
+        self._prune_candidates = True
+        # jobs added to the graph while updating dynamic jobs
+        self._added_jobs = None
 
         self.forcerules = set()
         self.forcefiles = set()
@@ -114,19 +158,36 @@ class DAG:
 
         self.periodic_wildcard_detector = PeriodicityDetector()
 
+        # file metadata is cached per run
+        iocache.clear()
+
         self.update_output_index()
 
     def init(self):
         """ Initialise the DAG. """
-        for job in map(self.rule2job, self.targetrules):
-            job = self.update([job])
-            self.targetjobs.add(job)
-
-        for file in self.targetfiles:
-            job = self.update(self.file2jobs(file), file=file)
-            self.targetjobs.add(job)
-
-        self.cleanup()
+        start = time.time()
+        if not self.cache_dag or not self.load_cache():
+            if self.input_function_threads:
+                self._input_function_pool = ThreadPoolExecutor(
+                    max_workers=self.input_function_threads)
+            try:
+                for job in map(self.rule2job, self.targetrules):
+                    job = self.update([job])
+                    self.targetjobs.add(job)
+
+                for file in self.targetfiles:
+                    job = self.update(self.file2jobs(file), file=file)
+                    self.targetjobs.add(job)
+            finally:
+                if self._input_function_pool is not None:
+                    self._input_function_pool.shutdown()
+                    self._input_function_pool = None
+
+            self.cleanup()
+            if self.cache_dag:
+                self.store_cache()
+        logger.debug("Inferred DAG in {:.2f} seconds.".format(
+            time.time() - start))
 
         self.update_needrun()
         self.set_until_jobs()
@@ -135,22 +196,175 @@ class DAG:
         # check if remaining jobs are valid
         for i, job in enumerate(self.jobs):
             job.is_valid()
+        for rule in sorted(self.rules, key=attrgetter("name")):
+            if rule.input_function_calls:
+                logger.debug("Called functions of rule {} {} times in {:.2f} "
+                             "seconds ({} values reused).".format(
+                                 rule, rule.input_function_calls,
+                                 rule.input_function_time,
+                                 rule.input_function_reuses))
+            rule.clear_input_function_cache()
 
-    def update_jobids(self):
-        for job in self.jobs:
+    @property
+    def dependencies(self):
+        """Mapping of each job to the mapping of its dependencies to the files
+        it needs from them."""
+        return self._graph.dependencies
+
+    @property
+    def depending(self):
+        """Mapping of each job to the mapping of the jobs depending on it to
+        the files they need from it."""
+        return self._graph.depending
+
+    def cache_signature(self):
+        """Return the components the cached DAG depends on, i.e. the
+        Snakefiles, the config and the rules."""
+        def digest(value):
+            return hashlib.sha256(value.encode()).hexdigest()
+
+        snakefiles = dict()
+        for snakefile in self.workflow.included:
+            try:
+                with open(snakefile, "rb") as f:
+                    snakefiles[snakefile] = hashlib.sha256(f.read()).hexdigest()
+            except OSError:
+                # e.g. a Snakefile included from an URL
+                snakefiles[snakefile] = None
+        config = json.dumps(self.workflow.globals["config"],
+                            sort_keys=True,
+                            default=repr)
+        rules = "\n".join(sorted(
+            "{} {} {}".format(rule.name, list(rule.output),
+                              [f for f in rule.input if isinstance(f, str)])
+            for rule in self.rules))
+        return dict(version=__version__,
+                    snakefiles=snakefiles,
+                    config=digest(config),
+                    rules=digest(rules))
+
+    @property
+    def cache_key(self):
+        """Return the key of the cached DAG for the requested targets."""
+        targets = json.dumps([sorted(self.targetfiles),
+                              sorted(rule.name for rule in self.targetrules),
+                              self.ignore_ambiguity])
+        return hashlib.sha256(targets.encode()).hexdigest()
+
+    def store_cache(self):
+        """Store the inferred DAG in the cache of the persistence module."""
+        if any(f.is_remote for f in self._missing_candidate_input):
+            logger.debug("Not caching DAG because the inference depends on "
+                         "missing remote files.")
+            return
+        jobs = list(self.jobs)
+        index = {job: i for i, job in enumerate(jobs)}
+        graph = dict(
+            signature=self.cache_signature(),
+            jobs=[(job.rule.name, job.wildcards_dict,
+                   sorted(map(str, job.input)), sorted(map(str, job.output)))
+                  for job in jobs],
+            edges=[(index[job_], i, sorted(map(str, files)))
+                   for i, job in enumerate(jobs)
+                   for job_, files in self.dependencies[job].items()],
+            targetjobs=sorted(index[job] for job in self.targetjobs),
+            dynamic=sorted(index[job] for job in self._dynamic),
+            missing=sorted(map(str, self._missing_candidate_input)))
+        self.workflow.persistence.store_dag_cache(self.cache_key, graph)
+
+    def load_cache(self):
+        """Load the DAG from the cache of the persistence module.
+
+        The cached DAG is only used if the Snakefiles, config, rules and
+        targets are unchanged, all jobs still have the same input and output
+        files, all input files that are not produced by another job exist
+        and no file whose absence made a candidate job fail during the
+        original inference has been created meanwhile. Otherwise, the
+        reasons are reported and False is returned.
+        """
+        graph = self.workflow.persistence.dag_cache(self.cache_key)
+        if graph is None:
+            logger.debug("No cached DAG found for the given targets.")
+            return False
+
+        invalid = list()
+        signature = self.cache_signature()
+        cached = graph["signature"]
+        if cached["version"] != signature["version"]:
+            invalid.append("Snakemake version has changed")
+        for snakefile in sorted(set(cached["snakefiles"]) |
+                                set(signature["snakefiles"])):
+            if (cached["snakefiles"].get(snakefile) !=
+                    signature["snakefiles"].get(snakefile) or
+                    signature["snakefiles"].get(snakefile) is None):
+                invalid.append("Snakefile {} has changed".format(snakefile))
+        if cached["config"] != signature["config"]:
+            invalid.append("config has changed")
+        if cached["rules"] != signature["rules"]:
+            invalid.append("rules have changed")
+        for f in graph["missing"]:
+            if os.path.exists(f):
+                invalid.append("file {} has been created".format(f))
+
+        jobs = list()
+        if not invalid:
+            rules = {rule.name: rule for rule in self.rules}
+            for rulename, wildcards, input, output in graph["jobs"]:
+                try:
+                    job = Job(rules[rulename], self, wildcards_dict=wildcards)
+                except (RuleException, WorkflowError) as e:
+                    invalid.append("job of rule {} failed: {}".format(
+                        rulename, e))
+                    break
+                if sorted(job.input) != input or sorted(job.output) != output:
+                    invalid.append("files of job {} have changed".format(job))
+                    break
+                jobs.append(job)
+
+        jobgraph = JobGraph()
+        if not invalid:
+            for job in jobs:
+                jobgraph.add_job(job)
+            inputfiles = [{f: f for f in job.input} for job in jobs]
+            for i, j, files in graph["edges"]:
+                jobgraph.add_edge(jobs[i], jobs[j],
+                                  map(inputfiles[j].__getitem__, files))
+            for job in jobs:
+                produced = set(chain(*jobgraph.dependencies[job].values()))
+                missing_input = [f for f in job.input
+                                 if f not in produced and
+                                 f not in job.subworkflow_input and
+                                 not f.exists]
+                if missing_input:
+                    invalid.append("missing input files of job {}: {}".format(
+                        job, ", ".join(missing_input)))
+                    break
+
+        if invalid:
+            logger.info("Cached DAG is outdated and will be rebuilt:\n\t" +
+                        "\n\t".join(invalid))
+            return False
+
+        jobgraph.compact()
+        self._graph = jobgraph
+        self.targetjobs = set(jobs[i] for i in graph["targetjobs"])
+        self._dynamic = set(jobs[i] for i in graph["dynamic"])
+        self._missing_candidate_input = set(graph["missing"])
+        logger.info("Loaded cached DAG of {} jobs.".format(len(jobs)))
+        return True
+
+    def update_jobids(self, jobs=None):
+        for job in self.jobs if jobs is None else jobs:
             if job not in self._jobid:
                 self._jobid[job] = len(self._jobid)
 
     def cleanup(self):
         self.job_cache.clear()
         final_jobs = set(self.jobs)
-        todelete = [job for job in self.dependencies if job not in final_jobs]
+        todelete = [job for job in self._graph if job not in final_jobs]
         for job in todelete:
-            del self.dependencies[job]
-            try:
-                del self.depending[job]
-            except KeyError:
-                pass
+            self._graph.remove_job(job)
+        self._graph.compact()
 
     def create_conda_envs(self):
         conda.check_conda()
@@ -235,6 +449,11 @@ class DAG:
         """Return the number of downstream jobs of a given job."""
         return self._downstream_size[job]
 
+    def critical_path(self, job):
+        """Return the estimated runtime of the longest path of jobs starting
+        with the given job, or 0 if runtimes are not considered."""
+        return self._critical_path.get(job, 0)
+
     def temp_input_count(self, job):
         """Return number of temporary input files of given job."""
         return self._temp_input_count[job]
@@ -298,6 +517,10 @@ class DAG:
         expanded_output = [job.shadowed_path(path) for path in job.expanded_output]
         if job.benchmark:
             expanded_output.append(job.benchmark)
+        # the job has (re)created its output
+        job.invalidate_output_metadata()
+        for f in expanded_output:
+            iocache.invalidate(f)
 
         if ignore_missing_output is False:
             try:
@@ -341,19 +564,24 @@ class DAG:
             shutil.move(shadow_output, real_output)
         shutil.rmtree(job.shadow_dir)
 
-    def check_periodic_wildcards(self, job):
-        """ Raise an exception if a wildcard of the given job appears to be periodic,
-        indicating a cyclic dependency. """
+    def periodic_wildcard(self, job):
+        """ Return a tuple (wildcard, value, periodic substring) for the first
+        wildcard of the given job that appears to be periodic, or None. """
         for wildcard, value in job.wildcards_dict.items():
             periodic_substring = self.periodic_wildcard_detector.is_periodic(
                 value)
             if periodic_substring is not None:
-                raise PeriodicWildcardError(
-                    "The value {} in wildcard {} is periodically repeated ({}). "
-                    "This would lead to an infinite recursion. "
-                    "To avoid this, e.g. restrict the wildcards in this rule to certain values.".format(
-                        periodic_substring, wildcard, value),
-                    rule=job.rule)
+                return wildcard, value, periodic_substring
+        return None
+
+    @staticmethod
+    def _periodic_wildcard_error(job, wildcard, value, periodic_substring):
+        return PeriodicWildcardError(
+            "The value {} in wildcard {} is periodically repeated ({}). "
+            "This would lead to an infinite recursion. "
+            "To avoid this, e.g. restrict the wildcards in this rule to certain values.".format(
+                periodic_substring, wildcard, value),
+            rule=job.rule)
 
     def handle_protected(self, job):
         """ Write-protect output files that are marked with protected(). """
@@ -386,7 +614,7 @@ class DAG:
 
         def unneeded_files():
             for job_, files in self.dependencies[job].items():
-                yield from filterfalse(partial(needed, job_), job_.temp_output & files)
+                yield from filterfalse(partial(needed, job_), job_.temp_output.intersection(files))
             if job not in self.targetjobs:
                 yield from filterfalse(partial(needed, job), job.temp_output)
 
@@ -423,7 +651,7 @@ class DAG:
                 putative = lambda f: f.is_remote and not f.protected and not f.should_keep_local
                 generated_input = set()
                 for job_, files in self.dependencies[job].items():
-                    generated_input |= files
+                    generated_input.update(files)
                     for f in filter(putative, files):
                         if not needed(job_, f):
                             yield f
@@ -448,6 +676,65 @@ class DAG:
 
     def update(self, jobs, file=None, visited=None, skip_until_dynamic=False):
         """ Update the DAG by adding given jobs and their dependencies. """
+        return self._raise_failure(
+            self._update, jobs, file=file, visited=visited,
+            skip_until_dynamic=skip_until_dynamic)
+
+    def update_(self, job, visited=None, skip_until_dynamic=False):
+        """ Update the DAG by adding the given job and its dependencies. """
+        self._raise_failure(
+            self._update_, job, visited=visited,
+            skip_until_dynamic=skip_until_dynamic)
+
+    def _raise_failure(self, update, *args, **kwargs):
+        result = self._resolve(update(*args, **kwargs))
+        if isinstance(result, _Failure):
+            if self._prune_candidates:
+                # Repeat without pruning candidate jobs in order to report
+                # the same error as if all candidates had been evaluated.
+                self._prune_candidates = False
+                try:
+                    result = self._resolve(update(*args, **kwargs))
+                finally:
+                    self._prune_candidates = True
+            if isinstance(result, _Failure):
+                raise result.exception()
+        return result
+
+    @staticmethod
+    def _resolve(call):
+        """Evaluate the given generator, which yields generators for nested
+        calls and receives their return values (or exceptions). Nested calls
+        are kept on an explicit stack instead of the Python call stack, such
+        that the depth of the DAG is not limited by the recursion limit."""
+        stack = [call]
+        value, error = None, None
+        while True:
+            try:
+                if error is None:
+                    call = stack[-1].send(value)
+                else:
+                    call = stack[-1].throw(error)
+            except StopIteration as e:
+                stack.pop()
+                value, error = e.value, None
+            except Exception as e:
+                stack.pop()
+                value, error = None, e
+            else:
+                stack.append(call)
+                value, error = None, None
+                continue
+            if not stack:
+                if error is not None:
+                    raise error
+                return value
+
+    def _update(self, jobs, file=None, visited=None, skip_until_dynamic=False,
+                failures=()):
+        """Generator implementing update(), see _resolve(). Returns the
+        selected job, or a _Failure if no candidate job is viable. The given
+        failures are those of already discarded candidates."""
         if visited is None:
             visited = set()
         producer = None
@@ -455,7 +742,6 @@ class DAG:
         jobs = sorted(jobs, reverse=not self.ignore_ambiguity)
         cycles = list()
 
-
         for job in jobs:
             logger.dag_debug(dict(status="candidate", job=job))
             if file in job.input:
@@ -464,96 +750,150 @@ class DAG:
             if job in visited:
                 cycles.append(job)
                 continue
-            try:
-                self.check_periodic_wildcards(job)
-                self.update_(job,
-                             visited=set(visited),
-                             skip_until_dynamic=skip_until_dynamic)
-                # TODO this might fail if a rule discarded here is needed
-                # elsewhere
-                if producer:
-                    if job < producer or self.ignore_ambiguity:
-                        break
-                    elif producer is not None:
-                        raise AmbiguousRuleException(file, job, producer)
-                producer = job
-            except (MissingInputException, CyclicGraphException,
-                    PeriodicWildcardError) as ex:
-                exceptions.append(ex)
-            except RecursionError as e:
+            periodic = self.periodic_wildcard(job)
+            if periodic is not None:
+                exceptions.append(_Failure(self._periodic_wildcard_error,
+                                           job, *periodic))
+                continue
+            if len(visited) >= self.max_dependency_depth:
                 raise WorkflowError(
-                    e, "If building the DAG exceeds the recursion limit, "
-                    "this is likely due to a cyclic dependency."
+                    "The DAG exceeds a depth of {} jobs, "
+                    "this is likely due to a cyclic dependency. "
                     "E.g. you might have a sequence of rules that "
                     "can generate their own input. Try to make "
                     "the output files more specific. "
                     "A common pattern is to have different prefixes "
-                    "in the output files of different rules." +
-                    "\nProblematic file pattern: {}".format(file) if file else
-                    "")
+                    "in the output files of different rules.".format(
+                        self.max_dependency_depth) +
+                    ("\nProblematic file pattern: {}".format(file)
+                     if file else ""))
+            failure = yield self._update_(
+                job, visited=visited, skip_until_dynamic=skip_until_dynamic)
+            if failure is not None:
+                exceptions.append(failure)
+                continue
+            # TODO this might fail if a rule discarded here is needed
+            # elsewhere
+            if producer:
+                if job < producer or self.ignore_ambiguity:
+                    break
+                elif producer is not None:
+                    raise AmbiguousRuleException(file, job, producer)
+            producer = job
         if producer is None:
             if cycles:
                 job = cycles[0]
-                raise CyclicGraphException(job.rule, file, rule=job.rule)
+                return _Failure(CyclicGraphException, job.rule, file,
+                                rule=job.rule)
+            exceptions.extend(failures)
             if exceptions:
-                raise exceptions[0]
-        
+                return exceptions[0]
+
         logger.dag_debug(dict(status="selected", job=job))
 
         return producer
 
-    def update_(self, job, visited=None, skip_until_dynamic=False):
-        """ Update the DAG by adding the given job and its dependencies. """
-        if job in self.dependencies:
+    def _update_(self, job, visited=None, skip_until_dynamic=False):
+        """Generator implementing update_(), see _resolve(). Returns a
+        _Failure if the job is not viable."""
+        if job in self._graph:
             return
         if visited is None:
             visited = set()
+        # visited holds the jobs on the path from the target to this job
         visited.add(job)
-        dependencies = self.dependencies[job]
-        potential_dependencies = self.collect_potential_dependencies(
-            job).items()
-
-        skip_until_dynamic = skip_until_dynamic and not job.dynamic_output
-
-        missing_input = job.missing_input
-        producer = dict()
-        exceptions = dict()
-        for file, jobs in potential_dependencies:
-            try:
-                selected_job = self.update(
+        try:
+            self._graph.add_job(job)
+            if self._added_jobs is not None:
+                self._added_jobs.append(job)
+            potential_dependencies = self._potential_dependencies(
+                job).items()
+
+            skip_until_dynamic = skip_until_dynamic and not job.dynamic_output
+
+            missing_input = job.missing_input
+            producer = dict()
+            for file, (jobs, failures) in potential_dependencies:
+                selected_job = yield self._update(
                     jobs,
                     file=file,
                     visited=visited,
                     skip_until_dynamic=skip_until_dynamic or file in
-                    job.dynamic_input)
-                producer[file] = selected_job
-            except (MissingInputException, CyclicGraphException,
-                    PeriodicWildcardError) as ex:
-                if file in missing_input:
-                    self.delete_job(job,
-                                    recursive=False)  # delete job from tree
-                    raise ex
+                    job.dynamic_input,
+                    failures=failures)
+                if isinstance(selected_job, _Failure):
+                    if file in missing_input:
+                        self.delete_job(job,
+                                        recursive=False)  # delete job from tree
+                        return selected_job
+                else:
+                    producer[file] = selected_job
+        finally:
+            visited.discard(job)
 
+        files = defaultdict(set)
         for file, job_ in producer.items():
-            dependencies[job_].add(file)
-            self.depending[job_][job].add(file)
+            files[job_].add(file)
+        for job_, files_ in files.items():
+            self._graph.add_edge(job_, job, files_)
 
         missing_input -= producer.keys()
         if missing_input:
+            if self.cache_dag:
+                self._missing_candidate_input.update(missing_input)
             self.delete_job(job, recursive=False)  # delete job from tree
-            raise MissingInputException(job.rule, missing_input)
+            return _Failure(MissingInputException, job.rule, missing_input)
 
         if skip_until_dynamic:
             self._dynamic.add(job)
 
-    def update_needrun(self):
-        """ Update the information whether a job needs to be executed. """
-
-        def output_mintime(job):
-            for job_ in self.bfs(self.depending, job):
-                t = job_.output_mintime
+    def prefetch_metadata(self, jobs=None):
+        """Fetch the metadata of all input, output and benchmark files of
+        the given jobs (default: all jobs of the DAG) concurrently."""
+        if not self.prefetch_threads:
+            return
+        start = time.time()
+
+        def files():
+            for job in self.jobs if jobs is None else jobs:
+                yield from job.input
+                yield from job.output
+                if job.benchmark:
+                    yield job.benchmark
+
+        n = iocache.prefetch(filterfalse(attrgetter("is_remote"), files()),
+                             threads=self.prefetch_threads)
+        if n:
+            duration = time.time() - start
+            logger.debug("Prefetched metadata of {} files with {} threads in "
+                         "{:.2f} seconds ({:.0f} files/s).".format(
+                             n, self.prefetch_threads, duration,
+                             n / max(duration, 1e-6)))
+
+    def update_needrun(self, jobs=None):
+        """ Update the information whether a job needs to be executed.
+
+        If jobs are given, only these are updated. They have to include all
+        their unfinished downstream jobs.
+        """
+        self.prefetch_metadata(jobs)
+
+        def downstream_mintime():
+            """For each job, determine the output mintime of the nearest
+            job in its downstream (including the job itself) with existing
+            output. Among equally near jobs, the oldest output is taken."""
+            nearest = dict()
+            for job in reversed(self.toposorted(candidates)):
+                t = job.output_mintime
                 if t:
-                    return t
+                    nearest[job] = (0, t)
+                    continue
+                downstream = [nearest[job_] for job_ in self.depending[job]
+                              if job_ in nearest]
+                if downstream:
+                    dist, t = min(downstream)
+                    nearest[job] = (dist + 1, t)
+            return {job: t for job, (_, t) in nearest.items()}
 
         def needrun(job):
             reason = self.reason(job)
@@ -585,7 +925,7 @@ class DAG:
                             ))) | self.targetfiles)
                     reason.missing_output.update(missing_output)
             if not reason:
-                output_mintime_ = output_mintime(job)
+                output_mintime_ = output_mintime.get(job)
                 if output_mintime_:
                     updated_input = [
                         f
@@ -602,16 +942,24 @@ class DAG:
         dependencies = self.dependencies
         depending = self.depending
 
-        _needrun.clear()
-        candidates = set(self.jobs)
+        if jobs is None:
+            _needrun.clear()
+            candidates = set(self.jobs)
+        else:
+            candidates = set(jobs)
+            _needrun.difference_update(candidates)
+        output_mintime = downstream_mintime()
 
-        queue = list(filter(reason, map(needrun, candidates)))
+        queue = deque(filter(reason, map(needrun, candidates)))
         visited = set(queue)
         while queue:
-            job = queue.pop(0)
+            job = queue.popleft()
             _needrun.add(job)
 
             for job_, files in dependencies[job].items():
+                if job_ not in candidates and job_ in _needrun:
+                    # unaffected job that is already known to need a run
+                    continue
                 missing_output = job_.missing_output(requested=files)
                 reason(job_).missing_output.update(missing_output)
                 if missing_output and not job_ in visited:
@@ -665,98 +1013,189 @@ class DAG:
             return
         self.targetjobs = set(self.until_jobs())
 
-    def update_priority(self):
+    def update_priority(self, jobs=None):
         """ Update job priorities. """
         prioritized = (
             lambda job: job.rule in self.priorityrules or not self.priorityfiles.isdisjoint(job.output)
         )
-        for job in self.needrun_jobs:
+        needrun_jobs = self.needrun_jobs if jobs is None else list(
+            filter(self.needrun, jobs))
+        for job in needrun_jobs:
             self._priority[job] = job.rule.priority
         for job in self.bfs(self.dependencies,
-                            *filter(prioritized, self.needrun_jobs),
+                            *filter(prioritized, needrun_jobs),
                             stop=self.noneedrun_finished):
             self._priority[job] = Job.HIGHEST_PRIORITY
 
-    def update_ready(self):
-        """ Update information whether a job is ready to execute. """
-        for job in filter(self.needrun, self.jobs):
-            if not self.finished(job) and self._ready(job):
-                self._ready_jobs.add(job)
-
-    def update_downstream_size(self):
-        """For each job, update number of downstream jobs."""
-        for job in self.needrun_jobs:
-            self._downstream_size[job] = sum(
-                1
-                for _ in self.bfs(self.depending,
-                                  job,
-                                  stop=self.noneedrun_finished)) - 1
+    def update_ready(self, jobs=None):
+        """ Update information whether a job is ready to execute.
 
-    def update_temp_input_count(self):
+        This initializes the number of unfinished dependencies of each job
+        (default: all jobs), which is afterwards maintained by finish().
+        """
+        if jobs is None:
+            self._n_unfinished_deps = dict()
+            jobs = self.jobs
+        for job in filter(self.needrun, jobs):
+            if not self.finished(job):
+                n = sum(1 for job_ in self.dependencies[job]
+                        if self.needrun(job_) and not self.finished(job_))
+                self._n_unfinished_deps[job] = n
+                if not n:
+                    self._ready_jobs.add(job)
+                else:
+                    self._ready_jobs.discard(job)
+
+    def update_downstream_size(self, jobs=None):
+        """For each job, update number of downstream jobs.
+
+        Sizes are computed in a single reverse-topological pass over the
+        jobs that still need to run. They are exact if no such job has more
+        than one such dependency (i.e. the downstream jobs form a forest), or
+        if there are at most EXACT_DOWNSTREAM_SIZE_MAX_JOBS jobs, where sets
+        of downstream jobs are represented as bitsets. Otherwise, the
+        downstream of a job with multiple dependencies is split evenly among
+        them. This approximation preserves the total, e.g. a final
+        aggregation job is counted once instead of once per path.
+        If jobs are given, only these (including all their downstream jobs)
+        are considered.
+        """
+        jobs = list(self.needrun_jobs if jobs is None else filter(
+            self.needrun, jobs))
+        pending = set(jobs)
+        order = self.toposorted(jobs)
+        order.reverse()
+
+        def pending_depending(job):
+            return [job_ for job_ in self.depending[job] if job_ in pending]
+
+        indegree = {job: sum(1 for job_ in self.dependencies[job]
+                             if job_ in pending)
+                    for job in jobs}
+        forest = all(d <= 1 for d in indegree.values())
+        if forest or len(order) > self.EXACT_DOWNSTREAM_SIZE_MAX_JOBS:
+            share = dict()
+            for job in order:
+                size = sum(share[job_] for job_ in pending_depending(job))
+                self._downstream_size[job] = int(round(size))
+                share[job] = (size + 1) / max(indegree[job], 1)
+        else:
+            downstream = dict()
+            for i, job in enumerate(order):
+                bits = 1 << i
+                for job_ in pending_depending(job):
+                    bits |= downstream[job_]
+                downstream[job] = bits
+                self._downstream_size[job] = bin(bits).count("1") - 1
+
+    def update_critical_path(self, jobs=None):
+        """For each job, update the estimated runtime of the longest path of
+        jobs that still need to run, starting with the job. Rules without
+        recorded runtime are assumed to take the average recorded runtime.
+        If jobs are given, only these (including all their downstream jobs)
+        are considered."""
+        if self.runtimes is None:
+            return
+        default = (sum(self.runtimes.values()) / len(self.runtimes)
+                   if self.runtimes else 1)
+        jobs = list(self.needrun_jobs if jobs is None else filter(
+            self.needrun, jobs))
+        pending = set(jobs)
+        order = self.toposorted(jobs)
+        order.reverse()
+        for job in order:
+            self._critical_path[job] = self.runtimes.get(
+                job.rule.name, default) + max(
+                    (self._critical_path[job_] for job_ in self.depending[job]
+                     if job_ in pending), default=0)
+
+    def update_temp_input_count(self, jobs=None):
         """For each job update the number of temporary input files."""
-        for job in self.needrun_jobs:
+        for job in self.needrun_jobs if jobs is None else filter(
+                self.needrun, jobs):
             self._temp_input_count[job] = sum(1 for _ in self.temp_input(job))
 
-    def close_remote_objects(self):
+    def close_remote_objects(self, jobs=None):
         """Close all remote objects."""
-        for job in self.jobs:
+        for job in self.jobs if jobs is None else jobs:
             if not self.needrun(job):
                 job.close_remote()
 
-    def postprocess(self):
+    def postprocess(self, jobs=None):
         """Postprocess the DAG. This has to be invoked after any change to the
-        DAG topology."""
-        self.update_jobids()
-        self.update_needrun()
-        self.update_priority()
-        self.update_ready()
-        self.update_downstream_size()
-        self.update_temp_input_count()
-        self.close_remote_objects()
-
-    def _ready(self, job):
-        """Return whether the given job is ready to execute."""
-        return self._finished.issuperset(filter(self.needrun,
-                                                self.dependencies[job]))
+        DAG topology. If jobs are given, only these are postprocessed. They
+        have to include all unfinished jobs downstream of the change."""
+        self.update_jobids(jobs)
+        self.update_needrun(jobs)
+        self.update_priority(jobs)
+        self.update_ready(jobs)
+        self.update_downstream_size(jobs)
+        self.update_critical_path(jobs)
+        self.update_temp_input_count(jobs)
+        self.close_remote_objects(jobs)
 
     def finish(self, job, update_dynamic=True):
         """Finish a given job (e.g. remove from ready jobs, mark depending jobs
-        as ready)."""
+        as ready). Return the depending jobs that became ready."""
         job.close_remote()
+        job.invalidate_output_metadata()
 
+        newly_finished = job not in self._finished
         self._finished.add(job)
-        try:
-            self._ready_jobs.remove(job)
-        except KeyError:
-            pass
+        self._ready_jobs.discard(job)
+        self._n_unfinished_deps.pop(job, None)
         # mark depending jobs as ready
-        for job_ in self.depending[job]:
-            if self.needrun(job_) and self._ready(job_):
-                self._ready_jobs.add(job_)
+        newly_ready = []
+        if newly_finished and self.needrun(job):
+            for job_ in self.depending[job]:
+                n = self._n_unfinished_deps.get(job_)
+                if n is not None:
+                    n -= 1
+                    self._n_unfinished_deps[job_] = n
+                    if not n:
+                        self._ready_jobs.add(job_)
+                        newly_ready.append(job_)
 
         if update_dynamic and job.dynamic_output:
             logger.info("Dynamically updating jobs")
-            newjob = self.update_dynamic(job)
+            self._added_jobs = []
+            try:
+                newjob = self.update_dynamic(job)
+                added = [job_ for job_ in self._added_jobs
+                         if job_ in self._graph]
+            finally:
+                self._added_jobs = None
             if newjob:
                 # simulate that this job ran and was finished before
                 self.omitforce.add(newjob)
                 self._needrun.add(newjob)
                 self._finished.add(newjob)
 
-                self.postprocess()
+                # only the new job, the jobs added with the specialized
+                # rules (which can also be new dependencies, e.g. of another
+                # rule) and their downstream are affected
+                self.update_jobids([newjob])
+                self.postprocess(jobs=[
+                    job_ for job_ in self.bfs(self.depending, newjob, *added)
+                    if not self.finished(job_)])
                 self.handle_protected(newjob)
                 self.handle_touch(newjob)
-                # add finished jobs to len as they are not counted after new postprocess
-                self._len += len(self._finished)
+        return newly_ready
 
-    def new_job(self, rule, targetfile=None, format_wildcards=None):
+    def new_job(self, rule, targetfile=None, format_wildcards=None,
+                wildcards_dict=None):
         """Create new job for given rule and (optional) targetfile.
-        This will reuse existing jobs with the same wildcards."""
+        This will reuse existing jobs with the same wildcards. The wildcards
+        are determined from the targetfile unless given."""
         key = (rule, targetfile)
         if key in self.job_cache:
             assert targetfile is not None
             return self.job_cache[key]
-        wildcards_dict = rule.get_wildcards(targetfile)
+        if wildcards_dict is None:
+            wildcards_dict = rule.get_wildcards(targetfile)
+        else:
+            wildcards_dict = dict(wildcards_dict)
+            rule.check_wildcards(wildcards_dict)
         job = Job(rule, self, wildcards_dict=wildcards_dict, format_wildcards=format_wildcards)
         for f in job.output:
             self.job_cache[(rule, f)] = job
@@ -804,30 +1243,33 @@ class DAG:
 
     def delete_job(self, job, recursive=True, add_dependencies=False):
         """Delete given job from DAG."""
-        if job in self.targetjobs:
-            self.targetjobs.remove(job)
         if add_dependencies:
             for _job in self.dependencies[job]:
                 self.targetjobs.add(_job)
-        for job_ in self.depending[job]:
-            del self.dependencies[job_][job]
-        del self.depending[job]
-        for job_ in self.dependencies[job]:
-            depending = self.depending[job_]
-            del depending[job]
-            if not depending and recursive:
-                self.delete_job(job_)
-        del self.dependencies[job]
-        if job in self._needrun:
-            self._len -= 1
-            self._needrun.remove(job)
-            del self._reason[job]
-        if job in self._finished:
-            self._finished.remove(job)
-        if job in self._dynamic:
-            self._dynamic.remove(job)
-        if job in self._ready_jobs:
-            self._ready_jobs.remove(job)
+        # dependencies that are no longer needed are deleted as well,
+        # using a work list instead of recursion
+        queue = [job]
+        while queue:
+            job = queue.pop()
+            if job in self.targetjobs:
+                self.targetjobs.remove(job)
+            dependencies = list(self.dependencies[job])
+            self._graph.remove_job(job)
+            if recursive:
+                for job_ in dependencies:
+                    if job_ in self._graph and not self.depending[job_]:
+                        queue.append(job_)
+            if job in self._needrun:
+                self._len -= 1
+                self._needrun.remove(job)
+                del self._reason[job]
+            if job in self._finished:
+                self._finished.remove(job)
+            if job in self._dynamic:
+                self._dynamic.remove(job)
+            if job in self._ready_jobs:
+                self._ready_jobs.remove(job)
+            self._n_unfinished_deps.pop(job, None)
 
     def replace_job(self, job, newjob):
         """Replace given job with new job."""
@@ -843,36 +1285,94 @@ class DAG:
 
         for job_, files in depending:
             if not job_.dynamic_input:
-                self.dependencies[job_][newjob].update(files)
-                self.depending[newjob][job_].update(files)
+                self._graph.add_edge(newjob, job_, files)
 
     def specialize_rule(self, rule, newrule):
         """Specialize the given rule by inserting newrule into the DAG."""
         assert newrule is not None
         self.rules.add(newrule)
-        self.update_output_index()
+        self.output_index.add_rule(newrule)
+        # the new rule might produce previously unproducible input
+        self._unproducible_input.clear()
 
     def collect_potential_dependencies(self, job):
         """Collect all potential dependencies of a job. These might contain
         ambiguities."""
-        dependencies = defaultdict(list)
+        return {file: jobs
+                for file, (jobs, _) in self._potential_dependencies(
+                    job, prune=False).items()}
+
+    def _potential_dependencies(self, job, prune=True):
+        """Collect all potential dependencies of a job as a dict mapping
+        input files to tuples of candidate jobs and _Failures of candidates
+        that were pruned before creating a job."""
+        dependencies = dict()
         # use a set to circumvent multiple jobs for the same file
         # if user specified it twice
-        file2jobs = self.file2jobs
-        for file in set(job.input):
+        files = set(job.input)
+        if self._input_function_pool is not None:
+            self.prefetch_input_functions(
+                file for file in files
+                if file not in job.subworkflow_input and
+                file not in job.dependencies)
+        for file in files:
             # omit the file if it comes from a subworkflow
             if file in job.subworkflow_input:
                 continue
-            try:
-                if file in job.dependencies:
-                    jobs = [self.new_job(job.dependencies[file], targetfile=file)]
-                else:
-                    jobs = file2jobs(file)
-                dependencies[file].extend(jobs)
-            except MissingRuleException as ex:
-                pass
+            if file in job.dependencies:
+                dependencies[file] = (
+                    [self.new_job(job.dependencies[file], targetfile=file)],
+                    ())
+            else:
+                jobs, failures = self._file2candidates(file, prune=prune)
+                if jobs or failures:
+                    dependencies[file] = (jobs, failures)
         return dependencies
 
+    def prefetch_input_functions(self, files, prune=True):
+        """Evaluate the input functions of the candidate jobs for the given
+        files concurrently. The jobs are created afterwards in the usual
+        order, reusing the values, such that the resulting DAG and its
+        errors do not depend on the order of evaluation."""
+        prune = prune and self._prune_candidates
+        candidates = dict()
+        for file in files:
+            for rule, wildcards in self.output_index.producers(file):
+                if (wildcards is None or (rule, file) in self.job_cache or
+                        not any(map(is_callable, rule.input))):
+                    continue
+                if prune and self._missing_unproducible_input(rule,
+                                                              wildcards):
+                    continue
+                key = (rule, tuple(sorted(wildcards.items())))
+                candidates.setdefault(key, (rule, wildcards))
+        if len(candidates) < 2:
+            return
+        # consume the iterator in order to wait for all evaluations
+        list(self._input_function_pool.map(
+            lambda candidate: candidate[0].prefetch_input_functions(
+                candidate[1]), candidates.values()))
+
+    def toposorted(self, jobs):
+        """Return the given jobs in topological order, i.e. each job after
+        its dependencies. Edges to jobs outside of the given ones are
+        ignored."""
+        jobs = set(jobs)
+        indegree = {job: sum(1 for job_ in self.dependencies[job]
+                             if job_ in jobs)
+                    for job in jobs}
+        queue = deque(job for job, d in indegree.items() if not d)
+        ordered = list()
+        while queue:
+            job = queue.popleft()
+            ordered.append(job)
+            for job_ in self.depending[job]:
+                if job_ in indegree:
+                    indegree[job_] -= 1
+                    if not indegree[job_]:
+                        queue.append(job_)
+        return ordered
+
     def bfs(self, direction, *jobs, stop=lambda job: False):
         """Perform a breadth-first traversal of the DAG."""
         queue = list(jobs)
@@ -949,21 +1449,66 @@ class DAG:
         return self.new_job(targetrule)
 
     def file2jobs(self, targetfile):
-        rules = self.output_index.match(targetfile)
-        jobs = []
-        exceptions = list()
-        for rule in rules:
-            if rule.is_producer(targetfile):
-                try:
-                    jobs.append(self.new_job(rule, targetfile=targetfile))
-                except InputFunctionException as e:
-                    exceptions.append(e)
+        jobs, _ = self._file2candidates(targetfile, prune=False)
         if not jobs:
-            if exceptions:
-                raise exceptions[0]
             raise MissingRuleException(targetfile)
         return jobs
 
+    def _file2candidates(self, targetfile, prune=True):
+        """Return the jobs that can produce the given file, and _Failures
+        of candidate rules that were pruned because their jobs would miss
+        input files that no rule can produce."""
+        jobs = []
+        failures = []
+        exceptions = list()
+        prune = prune and self._prune_candidates
+        for rule, wildcards in self.output_index.producers(targetfile):
+            if prune and wildcards is not None:
+                missing_input = self._missing_unproducible_input(rule,
+                                                                 wildcards)
+                if missing_input:
+                    if self.cache_dag:
+                        self._missing_candidate_input.update(missing_input)
+                    failures.append(_Failure(MissingInputException, rule,
+                                             missing_input))
+                    continue
+            try:
+                jobs.append(self.new_job(rule, targetfile=targetfile,
+                                         wildcards_dict=wildcards))
+            except InputFunctionException as e:
+                exceptions.append(e)
+        if not jobs and not failures and exceptions:
+            raise exceptions[0]
+        return jobs, failures
+
+    def _missing_unproducible_input(self, rule, wildcards):
+        """Return the missing input files of the job of the given rule with
+        the given wildcards that no rule can produce, without creating the
+        job. Such a job can never be added to the DAG."""
+        patterns = self._unproducible_input.get(rule)
+        if patterns is None:
+            patterns = self._unproducible_input[rule] = [
+                (f, f.get_wildcard_names()) for f in rule.input
+                if self._unproducible(rule, f)]
+        missing_input = set()
+        for f, wildcard_names in patterns:
+            if wildcard_names <= wildcards.keys():
+                f = f.apply_wildcards(wildcards)
+                if not f.exists:
+                    missing_input.add(f)
+        return missing_input
+
+    def _unproducible(self, rule, f):
+        """Return whether no rule can produce any file matching the given
+        static, local input file pattern of the given rule."""
+        return (isinstance(f, _IOFile) and not is_callable(f) and
+                f not in rule.dynamic_input and
+                f not in rule.subworkflow_input and
+                f not in rule.dependencies and
+                not is_flagged(f, "subworkflow") and
+                not is_flagged(f, "remote_object") and
+                not self.output_index.may_produce(f.constant_prefix()))
+
     def rule_dot2(self):
         dag = defaultdict(list)
         visited = set()
@@ -1091,7 +1636,18 @@ class DAG:
                 log = "-" if log is None else ",".join(log)
 
                 input = self.workflow.persistence.input(f)
-                input = "-" if input is None else ",".join(input)
+                digest = self.workflow.persistence.input_digest(f)
+                if digest is not None:
+                    # only a digest is recorded for many input files
+                    if self.workflow.persistence.input_changed(job, file=f):
+                        input = "more than {} files ({})".format(
+                            MAX_RECORDED_INPUT_FILES, digest)
+                    else:
+                        input = ",".join(sorted(job.input))
+                elif input is None:
+                    input = "-"
+                else:
+                    input = ",".join(input)
 
                 shellcmd = self.workflow.persistence.shellcmd(f)
                 shellcmd = "-" if shellcmd is None else shellcmd
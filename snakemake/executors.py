@@ -318,6 +318,9 @@ class CPUExecutor(RealExecutor):
 class ClusterExecutor(RealExecutor):
 
     default_jobscript = "jobscript.sh"
+    # bounds of the interval (in seconds) between checks of an active job
+    min_wait_interval = 0.1
+    max_wait_interval = 1
 
     def __init__(self, workflow, dag, cores,
                  jobname="snakejob.{rulename}.{jobid}.sh",
@@ -360,7 +363,7 @@ class ClusterExecutor(RealExecutor):
             '--benchmark-repeats {benchmark_repeats} ',
             '--force-use-threads --wrapper-prefix {workflow.wrapper_prefix} ',
             '{overwrite_workdir} {overwrite_config} {printshellcmds} --nocolor ',
-            '--notemp --quiet --no-hooks --nolock'))
+            '--notemp --quiet --no-hooks --nolock --mode {} '.format(Mode.cluster)))
 
         if printshellcmds:
             self.exec_job += " --printshellcmds "
@@ -388,6 +391,9 @@ class ClusterExecutor(RealExecutor):
         self.active_jobs = list()
         self.lock = threading.Lock()
         self.wait = True
+        # id of active job -> [check interval, time of next check]
+        self._check_schedule = dict()
+        self._wakeup = threading.Event()
         self.wait_thread = threading.Thread(target=self._wait_for_jobs)
         self.wait_thread.daemon = True
         self.wait_thread.start()
@@ -395,12 +401,59 @@ class ClusterExecutor(RealExecutor):
     def shutdown(self):
         with self.lock:
             self.wait = False
+        self._wakeup.set()
         self.wait_thread.join()
         shutil.rmtree(self.tmpdir)
 
     def cancel(self):
         self.shutdown()
 
+    def add_active_job(self, active_job):
+        """ Register a submitted job to be checked by _wait_for_jobs. """
+        with self.lock:
+            self.active_jobs.append(active_job)
+            self._check_schedule[id(active_job)] = [
+                self.min_wait_interval, time.time() + self.min_wait_interval]
+        self._wakeup.set()
+
+    def _due_jobs(self):
+        """
+        Remove and return the active jobs that are due to be checked. Jobs
+        that are still running have to be added to the active jobs again.
+
+        Each job has its own check interval, which starts with
+        min_wait_interval when the job is submitted and is doubled with
+        each check up to max_wait_interval. Hence, short jobs are noticed
+        quickly, while jobs running for more than a few seconds are not
+        checked more often than every max_wait_interval seconds, regardless
+        of how many other jobs are submitted or finish.
+        """
+        now = time.time()
+        active_jobs = self.active_jobs
+        self.active_jobs = list()
+        due = list()
+        for active_job in active_jobs:
+            schedule = self._check_schedule[id(active_job)]
+            if schedule[1] <= now:
+                schedule[0] = min(2 * schedule[0], self.max_wait_interval)
+                schedule[1] = now + schedule[0]
+                due.append(active_job)
+            else:
+                self.active_jobs.append(active_job)
+        return due
+
+    def _sleep(self):
+        """ Sleep until the next active job is due to be checked. """
+        with self.lock:
+            self._check_schedule = {
+                id(active_job): self._check_schedule[id(active_job)]
+                for active_job in self.active_jobs}
+            next_check = min(
+                (schedule[1] for schedule in self._check_schedule.values()),
+                default=time.time() + self.max_wait_interval)
+        self._wakeup.wait(max(0, next_check - time.time()))
+        self._wakeup.clear()
+
     def _limit_rate(self):
         """Called in ``_run()`` for rate-limiting"""
         with self.rate_lock:
@@ -551,17 +604,14 @@ class GenericClusterExecutor(ClusterExecutor):
                 jobid, ext_jobid))
 
         submit_callback(job)
-        with self.lock:
-            self.active_jobs.append(GenericClusterJob(job, ext_jobid, callback, error_callback, jobscript, jobfinished, jobfailed))
+        self.add_active_job(GenericClusterJob(job, ext_jobid, callback, error_callback, jobscript, jobfinished, jobfailed))
 
     def _wait_for_jobs(self):
         while True:
             with self.lock:
                 if not self.wait:
                     return
-                active_jobs = self.active_jobs
-                self.active_jobs = list()
-                for active_job in active_jobs:
+                for active_job in self._due_jobs():
                     if os.path.exists(active_job.jobfinished):
                         os.remove(active_job.jobfinished)
                         os.remove(active_job.jobscript)
@@ -576,7 +626,7 @@ class GenericClusterExecutor(ClusterExecutor):
                         active_job.error_callback(active_job.job)
                     else:
                         self.active_jobs.append(active_job)
-            time.sleep(1)
+            self._sleep()
 
 
 SynchronousClusterJob = namedtuple("SynchronousClusterJob", "job jobid callback error_callback jobscript process")
@@ -642,17 +692,14 @@ class SynchronousClusterExecutor(ClusterExecutor):
                                            jobscript=jobscript), shell=True)
         submit_callback(job)
 
-        with self.lock:
-            self.active_jobs.append(SynchronousClusterJob(job, process.pid, callback, error_callback, jobscript, process))
+        self.add_active_job(SynchronousClusterJob(job, process.pid, callback, error_callback, jobscript, process))
 
     def _wait_for_jobs(self):
         while True:
             with self.lock:
                 if not self.wait:
                     return
-                active_jobs = self.active_jobs
-                self.active_jobs = list()
-                for active_job in active_jobs:
+                for active_job in self._due_jobs():
                     exitcode = active_job.process.poll()
                     if exitcode is None:
                         # job not yet finished
@@ -669,7 +716,7 @@ class SynchronousClusterExecutor(ClusterExecutor):
                         print_exception(ClusterJobException(active_job, self.dag.jobid(active_job.job)),
                                         self.workflow.linemaps)
                         active_job.error_callback(active_job.job)
-            time.sleep(1)
+            self._sleep()
 
 
 DRMAAClusterJob = namedtuple("DRMAAClusterJob", "job jobid callback error_callback jobscript")
@@ -756,8 +803,7 @@ class DRMAAExecutor(ClusterExecutor):
 
         submit_callback(job)
 
-        with self.lock:
-            self.active_jobs.append(DRMAAClusterJob(job, jobid, callback, error_callback, jobscript))
+        self.add_active_job(DRMAAClusterJob(job, jobid, callback, error_callback, jobscript))
 
     def shutdown(self):
         super().shutdown()
@@ -769,9 +815,7 @@ class DRMAAExecutor(ClusterExecutor):
             with self.lock:
                 if not self.wait:
                     return
-                active_jobs = self.active_jobs
-                self.active_jobs = list()
-                for active_job in active_jobs:
+                for active_job in self._due_jobs():
                     try:
                         retval = self.session.wait(active_job.jobid,
                                                    drmaa.Session.TIMEOUT_NO_WAIT)
@@ -796,7 +840,7 @@ class DRMAAExecutor(ClusterExecutor):
                             ClusterJobException(active_job, self.dag.jobid(active_job.job)),
                             self.workflow.linemaps)
                         active_job.error_callback(active_job.job)
-            time.sleep(1)
+            self._sleep()
 
 
 @contextlib.contextmanager
@@ -13,9 +13,13 @@ import datetime
 import json
 import copy
 import functools
+import sre_parse
+import sre_constants
 import subprocess as sp
+from string import Formatter
 from itertools import product, chain
-from collections import Iterable, namedtuple
+from collections import Iterable, namedtuple, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from snakemake.exceptions import MissingOutputException, WorkflowError, WildcardError, RemoteFileException
 from snakemake.logging import logger
 from inspect import isfunction, ismethod
@@ -23,12 +27,192 @@ from copy import deepcopy
 
 from snakemake.common import DYNAMIC_FILL
 
+try:
+    from os import scandir
+except ImportError:
+    # Python < 3.5
+    scandir = None
+
 
 def lstat(f):
     return os.stat(f,
                    follow_symlinks=os.stat not in os.supports_follow_symlinks)
 
 
+class IOCache:
+    """Cache for file metadata, such that each path is only stat'ed once per
+    run. Whenever Snakemake itself modifies a file, the corresponding entry
+    has to be invalidated."""
+
+    # minimum number of requested files in a directory for which the
+    # directory is listed instead of stat'ing each file
+    SCANDIR_MIN_FILES = 16
+
+    def __init__(self):
+        self._stat = dict()
+        self._lstat = dict()
+        self._listings = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, cache, path, follow_symlinks):
+        try:
+            st = cache[path]
+            self.hits += 1
+            return st
+        except KeyError:
+            self.misses += 1
+        st = _stat(path, follow_symlinks)
+        cache[path] = st
+        return st
+
+    def stat(self, path):
+        """Return the stat result of the given path (following symlinks) or
+        None if the path does not exist."""
+        return self._cached(self._stat, path, True)
+
+    def lstat(self, path):
+        """Return the stat result of the given path (without following
+        symlinks if possible) or None if the path does not exist."""
+        return self._cached(self._lstat, path,
+                            os.stat not in os.supports_follow_symlinks)
+
+    def prefetch(self, paths, threads=1):
+        """Fetch the metadata of the given paths with the given number of
+        threads. Paths are processed per directory, and directories with
+        many requested paths are listed with os.scandir, such that missing
+        files do not need a stat call. Return the number of fetched paths."""
+        bydir = defaultdict(list)
+        for path in set(paths):
+            if path not in self._stat or path not in self._lstat:
+                bydir[os.path.dirname(path)].append(path)
+        if not bydir:
+            return 0
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for fetched in executor.map(self._fetch, bydir.items()):
+                for path, st, lst in fetched:
+                    self._stat[path] = st
+                    self._lstat[path] = lst
+        return sum(map(len, bydir.values()))
+
+    def _fetch(self, item):
+        dirname, paths = item
+        follow_lstat = os.stat not in os.supports_follow_symlinks
+        if scandir is not None and len(paths) >= self.SCANDIR_MIN_FILES:
+            names = set(os.path.basename(path) for path in paths)
+            try:
+                entries = {entry.name: entry
+                           for entry in scandir(dirname or ".")
+                           if entry.name in names}
+            except OSError:
+                # e.g. missing directory or permissions, handled below
+                entries = None
+            if entries is not None:
+                fetched = []
+                for path in paths:
+                    name = os.path.basename(path)
+                    if name in ("", ".", ".."):
+                        fetched.append((path, _stat(path, True),
+                                        _stat(path, follow_lstat)))
+                        continue
+                    entry = entries.get(name)
+                    if entry is None:
+                        fetched.append((path, None, None))
+                        continue
+                    try:
+                        lst = entry.stat(follow_symlinks=follow_lstat)
+                    except OSError:
+                        lst = None
+                    if entry.is_symlink() or follow_lstat:
+                        try:
+                            st = entry.stat(follow_symlinks=True)
+                        except OSError:
+                            # broken symlink
+                            st = None
+                    else:
+                        st = lst
+                    fetched.append((path, st, lst))
+                return fetched
+        return [(path, _stat(path, True), _stat(path, follow_lstat))
+                for path in paths]
+
+    def invalidate(self, path):
+        """Forget the metadata of the given path."""
+        self._stat.pop(path, None)
+        self._lstat.pop(path, None)
+
+    def listdir(self, path):
+        """Return the entries of the given directory as a tuple of the
+        names of files, of directories and of the directories that os.walk
+        descends into (i.e. no symlinks), each in the order of os.walk.
+        Listings are reused as long as the directory is unmodified."""
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return (), (), ()
+        cached = self._listings.get(path)
+        # on file systems with coarse timestamps, a modification shortly
+        # after listing might not change the mtime
+        if cached is not None and cached[0] == mtime and cached[1] > mtime + 1:
+            return cached[2]
+        listed = time.time()
+        listing = _listdir(path)
+        self._listings[path] = (mtime, listed, listing)
+        return listing
+
+    def clear(self):
+        self._stat.clear()
+        self._lstat.clear()
+        self._listings.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def _stat(path, follow_symlinks):
+    try:
+        return os.stat(path, follow_symlinks=follow_symlinks)
+    except OSError:
+        # missing file (or e.g. missing permission), the same as in
+        # os.path.exists
+        return None
+
+
+def _listdir(path):
+    files, dirs, walkable = [], [], []
+    try:
+        if scandir is None:
+            for name in os.listdir(path):
+                f = os.path.join(path, name)
+                if os.path.isdir(f):
+                    dirs.append(name)
+                    if not os.path.islink(f):
+                        walkable.append(name)
+                else:
+                    files.append(name)
+        else:
+            for entry in scandir(path):
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    dirs.append(entry.name)
+                    try:
+                        if not entry.is_symlink():
+                            walkable.append(entry.name)
+                    except OSError:
+                        pass
+                else:
+                    files.append(entry.name)
+    except OSError:
+        # like os.walk, ignore unreadable directories
+        return (), (), ()
+    return tuple(files), tuple(dirs), tuple(walkable)
+
+
+iocache = IOCache()
+
+
 def lutime(f, times):
     #In some cases, we have a platform where os.supports_follow_symlink includes stat()
     #but not utime().  This leads to an anomaly.  In any case we never want to touch the
@@ -157,7 +341,7 @@ class _IOFile(str):
 
     @property
     def exists_local(self):
-        return os.path.exists(self.file)
+        return iocache.stat(self.file) is not None
 
     @property
     def exists_remote(self):
@@ -175,7 +359,11 @@ class _IOFile(str):
     @property
     def mtime_local(self):
         # do not follow symlinks for modification time
-        return lstat(self.file).st_mtime
+        st = iocache.lstat(self.file)
+        if st is None:
+            # raise the appropriate error
+            st = lstat(self.file)
+        return st.st_mtime
 
     @property
     def flags(self):
@@ -190,7 +378,11 @@ class _IOFile(str):
     def size_local(self):
         # follow symlinks but throw error if invalid
         self.check_broken_symlink()
-        return os.path.getsize(self.file)
+        st = iocache.stat(self.file)
+        if st is None:
+            # raise the appropriate error
+            return os.path.getsize(self.file)
+        return st.st_size
 
     def check_broken_symlink(self):
         """ Raise WorkflowError if file is a broken symlink. """
@@ -209,12 +401,17 @@ class _IOFile(str):
             #is the best we can do.
             return self.mtime > time
         else:
-            return os.stat(self, follow_symlinks=True).st_mtime > time or self.mtime > time
+            st = iocache.stat(self.file)
+            if st is None:
+                # raise the appropriate error
+                st = os.stat(self, follow_symlinks=True)
+            return st.st_mtime > time or self.mtime > time
 
     def download_from_remote(self):
         if self.is_remote and self.remote_object.exists():
             logger.info("Downloading from remote: {}".format(self.file))
             self.remote_object.download()
+            iocache.invalidate(self.file)
         else:
             raise RemoteFileException(
                 "The file to be downloaded does not seem to exist remotely.")
@@ -236,6 +433,7 @@ class _IOFile(str):
                     raise e
 
     def protect(self):
+        iocache.invalidate(self.file)
         mode = (lstat(self.file).st_mode & ~stat.S_IWUSR & ~stat.S_IWGRP
                 & ~stat.S_IWOTH)
         if os.path.isdir(self.file):
@@ -252,6 +450,7 @@ class _IOFile(str):
 
     def touch(self, times=None):
         """ times must be 2-tuple: (atime, mtime) """
+        iocache.invalidate(self.file)
         try:
             lutime(self.file, times)
         except OSError as e:
@@ -271,12 +470,17 @@ class _IOFile(str):
             # create empty file
             with open(self.file, "w") as f:
                 pass
+            iocache.invalidate(self.file)
 
     def apply_wildcards(self,
                         wildcards,
                         fill_missing=False,
                         fail_dynamic=False):
         f = self._file
+        if not self._is_function and "{" not in f and not self.is_remote:
+            # there are no wildcards to apply, hence all jobs can share this
+            # file (e.g. the static input of aggregating jobs)
+            return self
         if self._is_function:
             f = self._file(Namedlist(fromdict=wildcards))
 
@@ -304,7 +508,7 @@ class _IOFile(str):
     def regex(self):
         if self._regex is None:
             # compile a regular expression
-            self._regex = re.compile(regex(self.file))
+            self._regex = compiled_regex(self.file)
         return self._regex
 
     def constant_prefix(self):
@@ -320,13 +524,18 @@ class _IOFile(str):
         return self.replace(DYNAMIC_FILL, "{*}")
 
     def clone_flags(self, other):
-        if isinstance(self._file, str):
-            self._file = AnnotatedString(self._file)
-        if isinstance(other._file, AnnotatedString):
-            self._file.flags = getattr(other._file, "flags", {}).copy()
-            if "remote_object" in self._file.flags:
-                self._file.flags['remote_object'] = copy.copy(
-                    self._file.flags['remote_object'])
+        if not isinstance(other._file, AnnotatedString):
+            return
+        flags = other._file.flags
+        if "remote_object" in flags:
+            # remote objects refer to their file, hence each file needs its
+            # own copy
+            flags = flags.copy()
+            flags['remote_object'] = copy.copy(flags['remote_object'])
+        elif not flags and not isinstance(self._file, AnnotatedString):
+            return
+        # otherwise, the flags are shared with other (see flag())
+        self.set_flags(flags)
 
     def set_flags(self, flags):
         if isinstance(self._file, str):
@@ -387,6 +596,7 @@ def contains_wildcard_constraints(pattern):
 
 
 def remove(file, remove_non_empty_dir=False):
+    iocache.invalidate(file)
     if os.path.isdir(file) and not os.path.islink(file):
         if remove_non_empty_dir:
             shutil.rmtree(file)
@@ -408,7 +618,8 @@ def remove(file, remove_non_empty_dir=False):
             pass
 
 
-def regex(filepattern):
+@functools.lru_cache(maxsize=10000)
+def regex(filepattern, group_prefix=""):
     f = []
     last = 0
     wildcards = set()
@@ -420,39 +631,67 @@ def regex(filepattern):
                 raise ValueError(
                     "Constraint regex must be defined only in the first "
                     "occurence of the wildcard in a string.")
-            f.append("(?P={})".format(wildcard))
+            f.append("(?P={}{})".format(group_prefix, wildcard))
         else:
             wildcards.add(wildcard)
-            f.append("(?P<{}>{})".format(wildcard, match.group("constraint") if
-                                         match.group("constraint") else ".+"))
+            f.append("(?P<{}{}>{})".format(group_prefix, wildcard,
+                                           match.group("constraint") if
+                                           match.group("constraint") else ".+"))
         last = match.end()
     f.append(re.escape(filepattern[last:]))
     f.append("$")  # ensure that the match spans the whole file
     return "".join(f)
 
 
+@functools.lru_cache(maxsize=10000)
+def compiled_regex(filepattern):
+    """Return the compiled regex of the given filepattern."""
+    return re.compile(regex(filepattern))
+
+
+@functools.lru_cache(maxsize=10000)
+def wildcard_template(pattern):
+    """
+    Split the given pattern into a tuple of literal segments and a tuple
+    of the wildcard names between them, e.g. "{a}/b.{c}" into
+    ("", "/b.", "") and ("a", "c").
+    """
+    literals = []
+    names = []
+    last = 0
+    for match in _wildcard_regex.finditer(pattern):
+        literals.append(pattern[last:match.start()])
+        names.append(match.group("name"))
+        last = match.end()
+    literals.append(pattern[last:])
+    return tuple(literals), tuple(names)
+
+
 def apply_wildcards(pattern,
                     wildcards,
                     fill_missing=False,
                     fail_dynamic=False,
                     dynamic_fill=None,
                     keep_dynamic=False):
-    def format_match(match):
-        name = match.group("name")
+    if "{" not in pattern:
+        return str(pattern)
+    literals, names = wildcard_template(pattern)
+    f = [literals[0]]
+    for name, literal in zip(names, literals[1:]):
         try:
             value = wildcards[name]
             if fail_dynamic and value == dynamic_fill:
                 raise WildcardError(name)
-            return str(value)  # convert anything into a str
+            f.append(str(value))  # convert anything into a str
         except KeyError as ex:
             if keep_dynamic:
-                return "{{{}}}".format(name)
+                f.append("{{{}}}".format(name))
             elif fill_missing:
-                return dynamic_fill
+                f.append(dynamic_fill)
             else:
                 raise WildcardError(str(ex))
-
-    return re.sub(_wildcard_regex, format_match, pattern)
+        f.append(literal)
+    return "".join(f)
 
 
 def not_iterable(value):
@@ -473,7 +712,11 @@ class AnnotatedString(str):
 
 def flag(value, flag_type, flag_value=True):
     if isinstance(value, AnnotatedString):
-        value.flags[flag_type] = flag_value
+        # flags are shared among the files derived from the same pattern,
+        # hence they are copied instead of modified
+        flags = value.flags.copy()
+        flags[flag_type] = flag_value
+        value.flags = flags
         return value
     if not_iterable(value):
         value = AnnotatedString(value)
@@ -558,6 +801,24 @@ def touch(value):
 def unpack(value):
     return flag(value, "unpack")
 
+
+def impure(func):
+    """
+    Mark the given input, params or resources function as impure, i.e. it
+    shall be called for each job instead of reusing its value for jobs of
+    the same rule with the same wildcards.
+    """
+    @functools.wraps(func)
+    def impure_func(*args, **kwargs):
+        return func(*args, **kwargs)
+
+    impure_func.impure = True
+    return impure_func
+
+
+def is_impure(func):
+    return getattr(func, "impure", False)
+
 def expand(*args, **wildcards):
     """
     Expand wildcards in given filepatterns.
@@ -569,6 +830,16 @@ def expand(*args, **wildcards):
     **wildcards -- the wildcards as keyword arguments
         with their values as lists
     """
+    return list(lazy_expand(*args, **wildcards))
+
+
+def lazy_expand(*args, **wildcards):
+    """
+    Expand wildcards in given filepatterns like expand, but return a
+    LazyExpansion that yields the files on demand instead of a list.
+    In the input files of a rule, the files are only created when expanding
+    the input of a job.
+    """
     filepatterns = args[0]
     if len(args) == 1:
         combinator = product
@@ -577,18 +848,162 @@ def expand(*args, **wildcards):
     if isinstance(filepatterns, str):
         filepatterns = [filepatterns]
 
-    def flatten(wildcards):
-        for wildcard, values in wildcards.items():
-            if isinstance(values, str) or not isinstance(values, Iterable):
-                values = [values]
-            yield [(wildcard, value) for value in values]
+    def values(values):
+        if isinstance(values, str) or not isinstance(values, Iterable):
+            return [values]
+        return list(values)
+
+    return LazyExpansion(list(filepatterns), combinator,
+                         [(wildcard, values(v))
+                          for wildcard, v in wildcards.items()])
 
+
+def _format_fields(filepattern):
+    """
+    Split the given format string into its literal segments and the names
+    of the fields between them. Return None if a field is not a plain
+    name, e.g. has a format specification.
+    """
+    literals = []
+    names = []
+    literal = ""
     try:
-        return [filepattern.format(**comb)
-                for comb in map(dict, combinator(*flatten(wildcards)))
-                for filepattern in filepatterns]
-    except KeyError as e:
-        raise WildcardError("No values given for wildcard {}.".format(e))
+        for text, name, spec, conversion in Formatter().parse(filepattern):
+            # escaped braces split the literal text into multiple items
+            literal += text
+            if name is not None:
+                if spec or conversion or not name.isidentifier():
+                    return None
+                literals.append(literal)
+                names.append(name)
+                literal = ""
+    except ValueError:
+        return None
+    literals.append(literal)
+    return literals, names
+
+
+class LazyExpansion:
+    """
+    The files obtained by expanding wildcards in filepatterns, see
+    lazy_expand. The files are formatted on demand when iterating. With
+    the combinators itertools.product and zip, len() and membership tests
+    do not iterate over the files.
+    """
+
+    def __init__(self, filepatterns, combinator, wildcards):
+        self.filepatterns = filepatterns
+        self.combinator = combinator
+        # list of (wildcard, values) pairs
+        self.wildcards = wildcards
+        self._lookup = None
+
+    def __iter__(self):
+        fields = None
+        if (len(self.filepatterns) == 1 and
+                self.combinator in (product, zip)):
+            fields = _format_fields(self.filepatterns[0])
+        names = [wildcard for wildcard, _ in self.wildcards]
+        if fields is not None and set(fields[1]) <= set(names):
+            # format all values once and fill them into a %-template
+            literals, fieldnames = fields
+            template = "%s".join(literal.replace("%", "%%")
+                                 for literal in literals)
+            values = [["{}".format(value) for value in values]
+                      for _, values in self.wildcards]
+            index = [names.index(name) for name in fieldnames]
+            combinations = self.combinator(*values)
+            if index == list(range(len(names))):
+                return (template % comb for comb in combinations)
+            return (template % tuple(comb[i] for i in index)
+                    for comb in combinations)
+        return self._format()
+
+    def _format(self):
+        flattened = [[(wildcard, value) for value in values]
+                     for wildcard, values in self.wildcards]
+        try:
+            for comb in map(dict, self.combinator(*flattened)):
+                for filepattern in self.filepatterns:
+                    yield filepattern.format(**comb)
+        except KeyError as e:
+            raise WildcardError("No values given for wildcard {}.".format(e))
+
+    def __len__(self):
+        if self.combinator is product:
+            n = 1
+            for _, values in self.wildcards:
+                n *= len(values)
+        elif self.combinator is zip:
+            n = min((len(values) for _, values in self.wildcards), default=0)
+        else:
+            return sum(1 for _ in self)
+        return n * len(self.filepatterns)
+
+    def __contains__(self, f):
+        if self.combinator not in (product, zip):
+            return any(f == f_ for f_ in self)
+        names = set(wildcard for wildcard, _ in self.wildcards)
+        patterns = list(map(_format_fields, self.filepatterns))
+        if any(fields is None or not set(fields[1]) <= names
+               for fields in patterns):
+            return any(f == f_ for f_ in self)
+        if not len(self):
+            return False
+        return any(self._match(f, literals, fieldnames)
+                   for literals, fieldnames in patterns)
+
+    def _match(self, f, literals, names):
+        """
+        Return whether f can be obtained by filling values of the
+        wildcards into the fields between the given literal segments.
+        """
+        if self._lookup is None:
+            # map the formatted values of each wildcard to their indices
+            n = len(self) // len(self.filepatterns)
+            self._lookup = dict()
+            for wildcard, values in self.wildcards:
+                lookup = self._lookup[wildcard] = defaultdict(set)
+                for i, value in enumerate(values):
+                    if self.combinator is product or i < n:
+                        lookup["{}".format(value)].add(i)
+        if not f.startswith(literals[0]):
+            return False
+
+        def match(i, pos, assigned, indices):
+            if i == len(names):
+                return pos == len(f)
+            name, literal = names[i], literals[i + 1]
+            if name in assigned:
+                value = assigned[name] + literal
+                return (f.startswith(value, pos) and
+                        match(i + 1, pos + len(value), assigned, indices))
+            if i == len(names) - 1:
+                ends = [len(f) - len(literal)] if f.endswith(literal) else []
+            else:
+                ends = [end for end in range(pos, len(f) + 1)
+                        if f.startswith(literal, end)]
+            for end in ends:
+                if end < pos:
+                    continue
+                value = f[pos:end]
+                indices_ = self._lookup[name].get(value)
+                if not indices_:
+                    continue
+                if self.combinator is zip:
+                    # all values have to stem from the same combination
+                    indices_ = indices_ if indices is None else indices & indices_
+                    if not indices_:
+                        continue
+                assigned[name] = value
+                if match(i + 1, end + len(literal), assigned, indices_):
+                    return True
+                del assigned[name]
+            return False
+
+        if not names:
+            return f == literals[0]
+        return match(0, len(literals[0]), dict(), None)
 
 
 def limit(pattern, **wildcards):
@@ -605,38 +1020,189 @@ def limit(pattern, **wildcards):
     })
 
 
-def glob_wildcards(pattern, files=None):
+def glob_wildcards(pattern, files=None, threads=1):
     """
     Glob the values of the wildcards by matching the given pattern to the filesystem.
     Returns a named tuple with a list of values for each wildcard.
+    Only directories that can contain matching files are listed (see
+    glob_files), with the given number of threads.
     """
     pattern = os.path.normpath(pattern)
-    first_wildcard = re.search("{[^{]", pattern)
-    dirname = os.path.dirname(pattern[:first_wildcard.start(
-    )]) if first_wildcard else os.path.dirname(pattern)
-    if not dirname:
-        dirname = "."
 
     names = [match.group('name')
              for match in _wildcard_regex.finditer(pattern)]
     Wildcards = namedtuple("Wildcards", names)
     wildcards = Wildcards(*[list() for name in names])
 
-    pattern = re.compile(regex(pattern))
-
     if files is None:
-        files = (os.path.normpath(os.path.join(dirpath, f))
-                 for dirpath, dirnames, filenames in os.walk(dirname)
-                 for f in chain(filenames, dirnames))
-
-    for f in files:
-        match = re.match(pattern, f)
-        if match:
-            for name, value in match.groupdict().items():
-                getattr(wildcards, name).append(value)
+        matches = glob_files(pattern, threads=threads)
+    else:
+        regex = compiled_regex(pattern)
+        matches = filter(None, map(regex.match, files))
+
+    for match in matches:
+        for name, value in match.groupdict().items():
+            getattr(wildcards, name).append(value)
     return wildcards
 
 
+def glob_files(pattern, threads=1):
+    """
+    Yield the match objects of the existing files and directories that
+    match the given normalized pattern, in the order of os.walk.
+
+    Wildcards may match slashes unless their constraint rules that out,
+    e.g. {sample,[^/]+}. Path components before the first wildcard that
+    may match a slash are matched one directory level at a time, such
+    that only directories that can contain matches are listed.
+    Components without wildcards are not listed at all. With threads > 1,
+    the subdirectories of a directory are listed concurrently.
+    """
+    first_wildcard = re.search("{[^{]", pattern)
+    root = os.path.dirname(pattern[:first_wildcard.start()]
+                           if first_wildcard else pattern) or "."
+    rest = pattern if root == "." else pattern[len(root):].lstrip("/")
+    if not rest:
+        return
+    full_regex = compiled_regex(pattern)
+    wildcards = list(_wildcard_regex.finditer(rest))
+    # only the first occurrence of a wildcard may have a constraint
+    constraints = dict()
+    for match in wildcards:
+        constraints.setdefault(match.group("name"), match.group("constraint"))
+    tail = rest[wildcards[-1].end():] if wildcards else rest
+
+    # split at the slashes outside of wildcards
+    separators = [i for i, c in enumerate(rest)
+                  if c == "/" and not any(match.start() < i < match.end()
+                                          for match in wildcards)]
+    components = []
+    for start, end in zip([0] + [i + 1 for i in separators],
+                          separators + [len(rest)]):
+        component = rest[start:end]
+        spanning = [match for match in wildcards
+                    if start <= match.start() < end and
+                    _may_match_slash(constraints[match.group("name")])]
+        if not any(start <= match.start() < end for match in wildcards):
+            components.append(("literal", component))
+        elif not spanning:
+            components.append(("component", compiled_regex(component)))
+        else:
+            # the remainder of the path may have any depth, but the
+            # component has to start with the part before the wildcard
+            prefix = component[:spanning[0].start() - start]
+            components.append(("prefix", re.compile(regex(prefix)[:-1])))
+            break
+
+    def join(path, name):
+        return name if path == "." else os.path.join(path, name)
+
+    def prefetch(paths):
+        if pool is not None and len(paths) > 1:
+            list(pool.map(iocache.listdir, paths))
+
+    def walk_all(path):
+        files, dirs, walkable = iocache.listdir(path)
+        for name in chain(files, dirs):
+            yield join(path, name)
+        subdirs = [join(path, name) for name in walkable]
+        prefetch(subdirs)
+        for subdir in subdirs:
+            yield from walk_all(subdir)
+
+    def walk(path, i):
+        kind, component = components[i]
+        last = i == len(components) - 1
+        if kind == "literal":
+            f = join(path, component)
+            if last:
+                if os.path.lexists(f):
+                    yield f
+            elif os.path.isdir(f) and not os.path.islink(f):
+                yield from walk(f, i + 1)
+            return
+        files, dirs, walkable = iocache.listdir(path)
+        if kind == "prefix" or last:
+            for name in chain(files, dirs):
+                if component.match(name):
+                    yield join(path, name)
+        if kind == "prefix" or not last:
+            subdirs = [join(path, name)
+                       for name in walkable if component.match(name)]
+            prefetch(subdirs)
+            for subdir in subdirs:
+                if kind == "prefix":
+                    yield from walk_all(subdir)
+                else:
+                    yield from walk(subdir, i + 1)
+
+    pool = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+    try:
+        for f in walk(root, 0):
+            if f.endswith(tail):
+                match = full_regex.match(f)
+                if match:
+                    yield match
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def _may_match_slash(constraint):
+    """
+    Return whether a wildcard with the given constraint may match a
+    string containing a slash. In case of doubt, return True.
+    """
+    if constraint is None:
+        return True
+    try:
+        return _may_match_char(sre_parse.parse(constraint), ord("/"))
+    except (sre_constants.error, TypeError, ValueError):
+        return True
+
+
+def _may_match_char(subpattern, char):
+    for op, av in subpattern:
+        if op is sre_constants.LITERAL:
+            if av == char:
+                return True
+        elif op is sre_constants.NOT_LITERAL:
+            if av != char:
+                return True
+        elif op is sre_constants.IN:
+            negate = False
+            contained = False
+            for op_, av_ in av:
+                if op_ is sre_constants.NEGATE:
+                    negate = True
+                elif op_ is sre_constants.LITERAL:
+                    contained |= av_ == char
+                elif op_ is sre_constants.RANGE:
+                    contained |= av_[0] <= char <= av_[1]
+                elif op_ is sre_constants.CATEGORY:
+                    contained |= av_ not in (sre_constants.CATEGORY_DIGIT,
+                                             sre_constants.CATEGORY_SPACE,
+                                             sre_constants.CATEGORY_WORD)
+                else:
+                    return True
+            if contained != negate:
+                return True
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            if _may_match_char(av[2], char):
+                return True
+        elif op is sre_constants.SUBPATTERN:
+            if _may_match_char(av[-1], char):
+                return True
+        elif op is sre_constants.BRANCH:
+            if any(_may_match_char(branch, char) for branch in av[1]):
+                return True
+        elif op not in (sre_constants.AT, sre_constants.ASSERT,
+                        sre_constants.ASSERT_NOT):
+            # e.g. any character or a group reference
+            return True
+    return False
+
+
 def update_wildcard_constraints(pattern,
                                 wildcard_constraints,
                                 global_wildcard_constraints):
@@ -671,18 +1237,30 @@ def update_wildcard_constraints(pattern,
     # inherit flags
     if isinstance(pattern, AnnotatedString):
         updated = AnnotatedString(updated)
-        updated.flags = deepcopy(pattern.flags)
+        if "remote_object" in pattern.flags:
+            updated.flags = deepcopy(pattern.flags)
+        else:
+            updated.flags = pattern.flags
     return updated
 
 
 
-# TODO rewrite Namedlist!
 class Namedlist(list):
     """
     A list that additionally provides functions to name items. Further,
     it is hashable, however the hash does not consider the item names.
+    Named items are accessible as attributes, by indexing with their name
+    and via get. Names take precedence over methods of the same name
+    (e.g. a wildcard called index).
+
+    Names refer to indices. Named items are kept as attributes right away,
+    whereas the Namedlist of a named range is only created on first access
+    and then kept as attribute.
     """
 
+    # the instance dict holds the named items and the accessed ranges
+    __slots__ = ["_names", "__dict__"]
+
     def __init__(self, toclone=None, fromdict=None, plainstr=False):
         """
         Create the object.
@@ -693,7 +1271,8 @@ class Namedlist(list):
             Namedlist (keys become names)
         """
         list.__init__(self)
-        self._names = dict()
+        # mapping of names to (index, end), created with the first name
+        self._names = None
 
         if toclone:
             self.extend(map(str, toclone) if plainstr else toclone)
@@ -720,19 +1299,37 @@ class Namedlist(list):
         Arguments
         name  -- a name
         index -- the item index
+        end   -- if given, the name refers to the items from index to end
         """
+        if self._names is None:
+            self._names = dict()
+        elif name in self._names:
+            self.__dict__.pop(name, None)
         self._names[name] = (index, end)
         if end is None:
-            setattr(self, name, self[index])
+            self.__dict__[name] = list.__getitem__(self, index)
+        elif name in _NAMEDLIST_ATTRIBUTES:
+            # attribute lookup would find the method instead of __getattr__
+            self._get_named(name)
+
+    def _get_named(self, name):
+        index, end = self._names[name]
+        if end is None:
+            item = list.__getitem__(self, index)
         else:
-            setattr(self, name, Namedlist(toclone=self[index:end]))
+            # a plain unnamed view, without going through __init__
+            item = Namedlist.__new__(Namedlist)
+            list.__init__(item, list.__getitem__(self, slice(index, end)))
+            item._names = None
+        self.__dict__[name] = item
+        return item
 
     def get_names(self):
         """
         Get the defined names as (name, index) pairs.
         """
-        for name, index in self._names.items():
-            yield name, index
+        if self._names:
+            yield from self._names.items()
 
     def take_names(self, names):
         """
@@ -742,51 +1339,76 @@ class Namedlist(list):
         names -- the given names as (name, index) pairs
         """
         for name, (i, j) in names:
-            self.set_name(name, i, end=j)
+            Namedlist.set_name(self, name, i, end=j)
 
     def items(self):
-        for name in self._names:
-            yield name, getattr(self, name)
+        for name in self._names or ():
+            yield name, self.get(name)
 
     def allitems(self):
         next = 0
-        for name, index in sorted(self._names.items(),
+        for name, index in sorted((self._names or dict()).items(),
                                   key=lambda item: item[1][0]):
             start, end = index
             if end is None:
                 end = start + 1
             if start > next:
-                for item in self[next:start]:
+                for item in list.__getitem__(self, slice(next, start)):
                     yield None, item
-            yield name, getattr(self, name)
+            yield name, self.get(name)
             next = end
-        for item in self[next:]:
+        for item in list.__getitem__(self, slice(next, None)):
             yield None, item
 
     def insert_items(self, index, items):
         self[index:index + 1] = items
         add = len(items) - 1
-        for name, (i, j) in self._names.items():
+        for name, (i, j) in list((self._names or dict()).items()):
             if i > index:
-                self._names[name] = (i + add, None if j is None else j + add)
+                Namedlist.set_name(self, name, i + add,
+                                   end=None if j is None else j + add)
             elif i == index:
-                self.set_name(name, i, end=i + len(items))
+                Namedlist.set_name(self, name, i, end=i + len(items))
 
     def keys(self):
-        return self._names
+        return self._names or dict()
 
     def plainstrings(self):
         return self.__class__.__call__(toclone=self, plainstr=True)
 
     def get(self, key, default_value=None):
-        return self.__dict__.get(key, default_value)
+        if self._names and key in self._names:
+            try:
+                return self.__dict__[key]
+            except KeyError:
+                return self._get_named(key)
+        return default_value
+
+    def __getattr__(self, name):
+        # only called if there is no attribute of the given name, i.e. for
+        # named items that have not been accessed yet
+        if name != "_names" and self._names and name in self._names:
+            return self._get_named(name)
+        raise AttributeError("'{}' object has no attribute '{}'".format(
+            type(self).__name__, name))
 
     def __getitem__(self, key):
         try:
             return super().__getitem__(key)
         except TypeError:
             pass
-        return getattr(self, key)
+        if self._names and key in self._names:
+            return self.get(key)
+        raise AttributeError("'{}' object has no attribute '{}'".format(
+            type(self).__name__, key))
+
+    def __reduce__(self):
+        # the named items are restored from the names (see __setstate__)
+        return (self.__class__, (list(self), ), self._names)
+
+    def __setstate__(self, names):
+        for name, (i, j) in (names or dict()).items():
+            Namedlist.set_name(self, name, i, end=j)
 
     def __hash__(self):
         return hash(tuple(self))
@@ -795,28 +1417,31 @@ class Namedlist(list):
         return " ".join(map(str, self))
 
 
+_NAMEDLIST_ATTRIBUTES = frozenset(dir(Namedlist))
+
+
 class InputFiles(Namedlist):
-    pass
+    __slots__ = []
 
 
 class OutputFiles(Namedlist):
-    pass
+    __slots__ = []
 
 
 class Wildcards(Namedlist):
-    pass
+    __slots__ = []
 
 
 class Params(Namedlist):
-    pass
+    __slots__ = []
 
 
 class Resources(Namedlist):
-    pass
+    __slots__ = []
 
 
 class Log(Namedlist):
-    pass
+    __slots__ = []
 
 
 def _load_configfile(configpath):
@@ -868,15 +1493,51 @@ class PeriodicityDetector:
     def __init__(self, min_repeat=50, max_repeat=100):
         """
         Args:
-            max_len (int): The maximum length of the periodic substring.
+            min_repeat (int): The minimum number of repeats of the periodic substring.
+            max_repeat (int): The maximum number of repeats of the periodic substring.
         """
-        self.regex = re.compile(
-            "((?P<value>.+)(?P=value){{{min_repeat},{max_repeat}}})$".format(
-                min_repeat=min_repeat - 1,
-                max_repeat=max_repeat - 1))
+        self.min_repeat = min_repeat
+        self.max_repeat = max_repeat
 
     def is_periodic(self, value):
-        """Returns the periodic substring or None if not periodic."""
-        m = self.regex.search(value)  # search for a periodic suffix.
-        if m is not None:
-            return m.group("value")
+        """Returns the periodic substring or None if not periodic.
+
+        A value is periodic if it ends with min_repeat to max_repeat
+        repeats of a substring. Of the longest such suffix, the longest
+        repeated substring is returned. This takes linear time, using the
+        prefix function of the reversed value.
+        """
+        if len(value) < self.min_repeat:
+            return None
+        # like the "$" of a regular expression, ignore a trailing newline,
+        # while the periodic suffix may not contain newlines
+        if value.endswith("\n"):
+            value = value[:-1]
+        value = value[value.rfind("\n") + 1:]
+        # the last character occurs in each repeat
+        if not value or value.count(value[-1]) < self.min_repeat:
+            return None
+
+        # suffixes of value are prefixes of the reversed value
+        reverse = value[::-1]
+        prefix = [0] * len(reverse)
+        k = 0
+        for i in range(1, len(reverse)):
+            c = reverse[i]
+            while k and reverse[k] != c:
+                k = prefix[k - 1]
+            if reverse[k] == c:
+                k += 1
+            prefix[i] = k
+
+        for length in range(len(reverse), self.min_repeat - 1, -1):
+            # the smallest period of the suffix
+            period = length - prefix[length - 1]
+            # the suffix is a repetition of substrings whose length is a
+            # multiple of the period, or of no shorter substring
+            repeats = 1 if length % period else length // period
+            for n in range(self.min_repeat, min(repeats, self.max_repeat) + 1):
+                if repeats % n == 0:
+                    start = len(value) - length
+                    return value[start:start + length // n]
+        return None
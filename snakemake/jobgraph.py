@@ -0,0 +1,206 @@
+__author__ = "Johannes Köster"
+__copyright__ = "Copyright 2017, Johannes Köster"
+__email__ = "koester@jimmy.harvard.edu"
+__license__ = "MIT"
+
+from collections.abc import Mapping
+
+
+class JobGraph:
+    """Compact storage of the topology of the DAG of jobs.
+
+    Jobs are mapped to integer ids. For each id and direction, the adjacent
+    jobs are stored as None (no adjacent jobs), a tuple (id, files) (one
+    adjacent job) or a dict mapping ids to files (multiple adjacent jobs).
+    The files of an edge are stored as one sorted tuple that is shared by
+    both directions and interned across edges.
+    The DAG accesses the topology via the mapping views dependencies and
+    depending, e.g. graph.dependencies[job] maps each dependency of job to
+    the files job needs from it.
+    """
+
+    __slots__ = ["_ids", "_jobs", "_dependencies", "_depending", "_free",
+                 "_filesets", "dependencies", "depending"]
+
+    def __init__(self):
+        self._ids = dict()
+        self._jobs = list()
+        self._dependencies = list()
+        self._depending = list()
+        self._free = list()
+        self._filesets = dict()
+        self.dependencies = Adjacency(self, self._dependencies)
+        self.depending = Adjacency(self, self._depending)
+
+    def __contains__(self, job):
+        return job in self._ids
+
+    def __iter__(self):
+        return iter(list(self._ids))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add_job(self, job):
+        """Add the given job if not yet present, and return its id."""
+        i = self._ids.get(job)
+        if i is None:
+            if self._free:
+                i = self._free.pop()
+                self._jobs[i] = job
+            else:
+                i = len(self._jobs)
+                self._jobs.append(job)
+                self._dependencies.append(None)
+                self._depending.append(None)
+            self._ids[job] = i
+        return i
+
+    def remove_job(self, job):
+        """Remove the given job and all its edges."""
+        i = self._ids.pop(job, None)
+        if i is None:
+            return
+        for j, _ in _items(self._dependencies[i]):
+            _delete(self._depending, j, i)
+        for j, _ in _items(self._depending[i]):
+            _delete(self._dependencies, j, i)
+        self._jobs[i] = None
+        self._dependencies[i] = None
+        self._depending[i] = None
+        self._free.append(i)
+
+    def add_edge(self, dependency, job, files):
+        """Add an edge denoting that job needs the given files from
+        dependency. Both jobs are added if necessary."""
+        i = self.add_job(job)
+        j = self.add_job(dependency)
+        files = set(files)
+        existing = _get(self._dependencies[i], j)
+        if existing is not None:
+            files.update(existing)
+        files = tuple(sorted(files))
+        files = self._filesets.setdefault(files, files)
+        _insert(self._dependencies, i, j, files)
+        _insert(self._depending, j, i, files)
+
+    def remove_edge(self, dependency, job):
+        """Remove the edge between the given jobs."""
+        i, j = self._ids[job], self._ids[dependency]
+        _delete(self._dependencies, i, j)
+        _delete(self._depending, j, i)
+
+    def compact(self):
+        """Release the interning table of file sets."""
+        self._filesets = dict()
+
+
+def _items(edges):
+    if edges is None:
+        return ()
+    if type(edges) is tuple:
+        return (edges, )
+    return edges.items()
+
+
+def _get(edges, j):
+    if edges is None:
+        return None
+    if type(edges) is tuple:
+        return edges[1] if edges[0] == j else None
+    return edges.get(j)
+
+
+def _insert(store, i, j, files):
+    edges = store[i]
+    if edges is None or (type(edges) is tuple and edges[0] == j):
+        store[i] = (j, files)
+    elif type(edges) is tuple:
+        store[i] = {edges[0]: edges[1], j: files}
+    else:
+        edges[j] = files
+
+
+def _delete(store, i, j):
+    edges = store[i]
+    if type(edges) is tuple and edges[0] == j:
+        store[i] = None
+    elif type(edges) is dict:
+        del edges[j]
+        if len(edges) == 1:
+            store[i] = next(iter(edges.items()))
+    else:
+        raise KeyError(j)
+
+
+class Adjacency:
+    """Read-only view of one direction of a JobGraph, mapping each job to
+    the mapping of its adjacent jobs to the files of the connecting edges.
+    Jobs that are not part of the graph have no adjacent jobs."""
+
+    __slots__ = ["_graph", "_store"]
+
+    def __init__(self, graph, store):
+        self._graph = graph
+        self._store = store
+
+    def __getitem__(self, job):
+        return Neighbors(self._graph, self._store, self._graph._ids.get(job))
+
+    def __contains__(self, job):
+        return job in self._graph
+
+    def __iter__(self):
+        return iter(self._graph)
+
+    def __len__(self):
+        return len(self._graph)
+
+
+class Neighbors(Mapping):
+    """Read-only view of the jobs adjacent to a job, mapping them to the
+    files of the connecting edges."""
+
+    __slots__ = ["_graph", "_store", "_id"]
+
+    def __init__(self, graph, store, id):
+        self._graph = graph
+        self._store = store
+        self._id = id
+
+    @property
+    def _edges(self):
+        if self._id is None:
+            return None
+        return self._store[self._id]
+
+    def __getitem__(self, job):
+        files = _get(self._edges, self._graph._ids.get(job))
+        if files is None:
+            raise KeyError(job)
+        return files
+
+    def __contains__(self, job):
+        return _get(self._edges, self._graph._ids.get(job)) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        edges = self._edges
+        if edges is None:
+            return 0
+        if type(edges) is tuple:
+            return 1
+        return len(edges)
+
+    def keys(self):
+        jobs = self._graph._jobs
+        return [jobs[j] for j, _ in _items(self._edges)]
+
+    def items(self):
+        jobs = self._graph._jobs
+        return [(jobs[j], files) for j, files in _items(self._edges)]
+
+    def values(self):
+        return [files for _, files in _items(self._edges)]
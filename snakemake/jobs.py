@@ -14,7 +14,7 @@ from itertools import chain
 from functools import partial
 from operator import attrgetter
 
-from snakemake.io import IOFile, Wildcards, Resources, _IOFile, is_flagged, contains_wildcard, lstat
+from snakemake.io import IOFile, Wildcards, Resources, _IOFile, is_flagged, contains_wildcard, lstat, iocache
 from snakemake.utils import format, listfiles
 from snakemake.exceptions import RuleException, ProtectedOutputException, WorkflowError
 from snakemake.exceptions import UnexpectedOutputException, CreateCondaEnvironmentException
@@ -90,11 +90,12 @@ class Job:
 
     def is_valid(self):
         """Check if job is valid"""
-        # these properties have to work in dry-run as well. Hence we check them here:
-        resources = self.rule.expand_resources(self.wildcards_dict, self.input)
-        self.rule.expand_params(self.wildcards_dict, self.input, self.output, resources)
-        self.rule.expand_benchmark(self.wildcards_dict)
-        self.rule.expand_log(self.wildcards_dict)
+        # these properties have to work in dry-run as well. Hence we check them here.
+        # Their values are kept for later use.
+        self.resources
+        self.params
+        self.benchmark
+        self.log
 
     def outputs_older_than_script(self):
         """return output that's older than script, i.e. script has changed"""
@@ -436,12 +437,20 @@ class Job:
         if protected:
             raise ProtectedOutputException(self.rule, protected)
 
+    def invalidate_output_metadata(self):
+        """Invalidate cached metadata of the output files of this job."""
+        for f in chain(self.expanded_output, self.log):
+            iocache.invalidate(f)
+        if self.benchmark:
+            iocache.invalidate(self.benchmark)
+
     def remove_existing_output(self):
         """Clean up both dynamic and regular output before rules actually run
         """
         if self.dynamic_output:
             for f, _ in chain(*map(self.expand_dynamic,
                                    self.rule.dynamic_output)):
+                iocache.invalidate(f)
                 os.remove(f)
 
         for f, f_ in zip(self.output, self.rule.output):
@@ -522,6 +531,8 @@ class Job:
 
     def cleanup(self):
         """ Cleanup output files. """
+        # the failed job might have created output files
+        self.invalidate_output_metadata()
         to_remove = [f for f in self.expanded_output if f.exists]
 
         to_remove.extend([f for f in self.remote_input if f.exists])
@@ -3,9 +3,10 @@ __copyright__ = "Copyright 2015, Johannes Köster"
 __email__ = "koester@jimmy.harvard.edu"
 __license__ = "MIT"
 
+import re
 from collections import defaultdict
 
-from snakemake.io import _IOFile
+from snakemake.io import _IOFile, regex, get_wildcard_names
 
 
 class Node:
@@ -30,14 +31,21 @@ class OutputIndex:
     """
     def __init__(self, rules):
         self.root = Node()
+        self._matchers = dict()
+        self._producers = dict()
 
         for rule in rules:
-            output = list(rule.output)
-            if rule.benchmark:
-                output.append(rule.benchmark)
-            for constant_prefix in sorted(map(_IOFile.constant_prefix,
-                                              output)):
-                self.add_output(rule, constant_prefix)
+            self.add_rule(rule)
+
+    def add_rule(self, rule):
+        self._matchers.clear()
+        self._producers.clear()
+        output = list(rule.output)
+        if rule.benchmark:
+            output.append(rule.benchmark)
+        for constant_prefix in sorted(map(_IOFile.constant_prefix,
+                                          output)):
+            self.add_output(rule, constant_prefix)
 
     def add_output(self, rule, constant_prefix):
         node = self.root
@@ -53,11 +61,100 @@ class OutputIndex:
         node = self.root
         rules = set()
         for c in f:
-            for rule in node.rules:
-                rules.add(rule)
+            rules.update(node.rules)
             node = node.children.get(c, None)
             if node is None:
                 return rules
-        for rule in node.rules:
-            rules.add(rule)
+        rules.update(node.rules)
         return rules
+
+    def may_produce(self, prefix):
+        """Return whether any rule may produce a file with the given
+        prefix."""
+        node = self.root
+        for c in prefix:
+            if node.rules:
+                return True
+            node = node.children.get(c, None)
+            if node is None:
+                return False
+        return bool(node.rules or node.children)
+
+    def _deepest_node(self, f):
+        node = self.root
+        for c in f:
+            child = node.children.get(c, None)
+            if child is None:
+                break
+            node = child
+        return node
+
+    def producers(self, f):
+        """Return a list of tuples (rule, wildcards) for all rules that
+        produce the given file. The wildcards are None if they have to be
+        determined via rule.get_wildcards. Results are memoized per file."""
+        producers = self._producers.get(f)
+        if producers is None:
+            # the candidate rules only depend on the deepest node reached
+            node = self._deepest_node(f)
+            matcher = self._matchers.get(node)
+            if matcher is None:
+                matcher = self._matchers[node] = ProductMatcher(self.match(f))
+            producers = self._producers[f] = matcher.match(f)
+        return producers
+
+
+class ProductMatcher:
+    """Match files against the products (output and benchmark files) of a
+    set of rules in a single pass. The combined regular expression tries
+    the pattern of each product in an optional lookahead, such that one
+    match yields the wildcard values of all matching products.
+    """
+
+    __slots__ = ["rules", "_products", "_regex"]
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        # for each rule, a list of tuples (group, wildcard groups) of
+        # its products
+        self._products = []
+        patterns = []
+        for rule in self.rules:
+            products = []
+            for product in rule.products:
+                group = "p{}".format(len(patterns))
+                prefix = group + "_"
+                patterns.append("(?:(?=(?P<{}>{})))?".format(
+                    group, regex(product.file, group_prefix=prefix)))
+                products.append((group, [(prefix + name, name)
+                                         for name in get_wildcard_names(
+                                             product.file)]))
+            self._products.append(products)
+        try:
+            self._regex = re.compile("".join(patterns))
+        except (re.error, ValueError, AssertionError, OverflowError):
+            # e.g. invalid wildcard constraints or too many groups,
+            # let the rules handle (and report) them
+            self._regex = None
+
+    def match(self, f):
+        if self._regex is None:
+            return [(rule, None) for rule in self.rules
+                    if rule.is_producer(f)]
+        groups = self._regex.match(f).groupdict()
+        producers = []
+        for rule, products in zip(self.rules, self._products):
+            bestmatch = None
+            bestmatchlen = 0
+            for group, wildcard_groups in products:
+                if groups[group] is None:
+                    continue
+                wildcards = {name: groups[group_]
+                             for group_, name in wildcard_groups}
+                l = rule.get_wildcard_len(wildcards)
+                if bestmatch is None or bestmatchlen > l:
+                    bestmatch = wildcards
+                    bestmatchlen = l
+            if bestmatch is not None:
+                producers.append((rule, bestmatch))
+        return producers
@@ -8,6 +8,7 @@ import shutil
 import signal
 import marshal
 import pickle
+import hashlib
 from base64 import urlsafe_b64encode
 from functools import lru_cache, partial
 from itertools import filterfalse, count
@@ -16,6 +17,14 @@ from snakemake.logging import logger
 from snakemake.jobs import jobfiles
 from snakemake.utils import listfiles
 
+# input tracking records a digest instead of the input files of jobs with
+# more input files than this
+MAX_RECORDED_INPUT_FILES = 1000
+# prefix of such digest records, file names cannot contain a null character
+INPUT_DIGEST_PREFIX = "\0sha256:"
+# number of latest job runtimes that are recorded for each rule
+MAX_RECORDED_RUNTIMES = 100
+
 
 class Persistence:
     def __init__(self, nolock=False, dag=None, warn_only=False):
@@ -40,11 +49,14 @@ class Persistence:
         self.shadow_path = os.path.join(self.path, "shadow")
         self.conda_env_path = os.path.join(self.path, "conda")
         self.conda_env_archive_path = os.path.join(self.path, "conda-archive")
+        self._dag_cache_path = os.path.join(self.path, "dag_cache")
+        self._runtime_path = os.path.join(self.path, "runtime_tracking")
 
         for d in (self._incomplete_path, self._version_path, self._code_path,
                   self._rule_path, self._input_path, self._log_path, self._params_path,
                   self._shellcmd_path, self.shadow_path, self.conda_env_path,
-                  self.conda_env_archive_path):
+                  self.conda_env_archive_path, self._dag_cache_path,
+                  self._runtime_path):
             if not os.path.exists(d):
                 os.mkdir(d)
 
@@ -168,11 +180,21 @@ class Persistence:
         return self._read_record(self._rule_path, path)
 
     def input(self, path):
+        """Return the recorded input files of the given output file, or None
+        if there is no record or only a digest (see input_digest)."""
         files = self._read_record(self._input_path, path)
-        if files is not None:
+        if files is not None and not files.startswith(INPUT_DIGEST_PREFIX):
             return files.split("\n")
         return None
 
+    def input_digest(self, path):
+        """Return the digest of the input files of the given output file if
+        there were more than MAX_RECORDED_INPUT_FILES, otherwise None."""
+        files = self._read_record(self._input_path, path)
+        if files is not None and files.startswith(INPUT_DIGEST_PREFIX):
+            return files[1:]
+        return None
+
     def log(self, path):
         files = self._read_record(self._log_path, path)
         if files is not None:
@@ -200,7 +222,8 @@ class Persistence:
             return bool(list(cr(file)))
 
     def input_changed(self, job, file=None):
-        cr = partial(self._changed_records, self._input_path, self._input(job))
+        cr = partial(self._changed_records, self._input_path, self._input(job),
+                     normalize=self._input_record)
         if file is None:
             return cr(*job.output)
         else:
@@ -214,6 +237,57 @@ class Persistence:
         else:
             return bool(list(cr(file)))
 
+    def dag_cache(self, key):
+        """Return the cached DAG stored under the given key or None."""
+        path = os.path.join(self._dag_cache_path, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            logger.debug("Ignoring unreadable DAG cache {}: {}".format(path, e))
+            return None
+
+    def store_dag_cache(self, key, graph):
+        """Store the given serialized DAG under the given key."""
+        path = os.path.join(self._dag_cache_path, key)
+        tmppath = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(tmppath, "wb") as f:
+                pickle.dump(graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except:
+            os.remove(tmppath)
+            raise
+        # replace atomically, such that concurrent readers never see a
+        # partially written cache
+        os.replace(tmppath, path)
+
+    def record_runtimes(self, runtimes):
+        """Record the given runtimes (in seconds) of the jobs of each rule
+        (by name), keeping the latest MAX_RECORDED_RUNTIMES per rule."""
+        for rule, times in runtimes.items():
+            history = self._runtimes(rule) + list(times)
+            self._record(self._runtime_path,
+                         "\n".join(map(str, history[-MAX_RECORDED_RUNTIMES:])),
+                         rule)
+
+    def runtimes(self, rules):
+        """Return the average recorded runtime of each of the given rules
+        (by name) that has recorded runtimes."""
+        runtimes = dict()
+        for rule in rules:
+            history = self._runtimes(rule)
+            if history:
+                runtimes[rule] = sum(history) / len(history)
+        return runtimes
+
+    def _runtimes(self, rule):
+        record = self._read_record(self._runtime_path, rule)
+        if not record:
+            return []
+        return [float(t) for t in record.split("\n")]
+
     def noop(self, *args):
         pass
 
@@ -227,7 +301,15 @@ class Persistence:
 
     @lru_cache()
     def _input(self, job):
-        return "\n".join(sorted(job.input))
+        return self._input_record("\n".join(sorted(job.input)))
+
+    def _input_record(self, input):
+        """Return the given newline separated input files, or their digest
+        if there are more than MAX_RECORDED_INPUT_FILES of them."""
+        if input.count("\n") >= MAX_RECORDED_INPUT_FILES:
+            return INPUT_DIGEST_PREFIX + hashlib.sha256(
+                input.encode()).hexdigest()
+        return input
 
     @lru_cache()
     def _log(self, job):
@@ -272,14 +354,20 @@ class Persistence:
         with open(self._record_path(subject, id), "rb" if bin else "r") as f:
             return f.read()
 
-    def _changed_records(self, subject, value, *ids, bin=False):
-        equals = partial(self._equals_record, subject, value, bin=bin)
+    def _changed_records(self, subject, value, *ids, bin=False,
+                         normalize=None):
+        equals = partial(self._equals_record, subject, value, bin=bin,
+                         normalize=normalize)
         return filter(
             lambda id: self._exists_record(subject, id) and not equals(id),
             ids)
 
-    def _equals_record(self, subject, value, id, bin=False):
-        return self._read_record(subject, id, bin=bin) == value
+    def _equals_record(self, subject, value, id, bin=False, normalize=None):
+        record = self._read_record(subject, id, bin=bin)
+        if normalize is not None and record is not None:
+            # records written by earlier versions may differ in form
+            record = normalize(record)
+        return record == value
 
     def _exists_record(self, subject, id):
         return os.path.exists(self._record_path(subject, id))
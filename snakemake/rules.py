@@ -8,11 +8,14 @@ import re
 import sys
 import inspect
 import sre_constants
-from collections import defaultdict, Iterable
+import time
+import threading
+import copy
+from collections import defaultdict, Iterable, Iterator
 
 from snakemake.io import IOFile, _IOFile, protected, temp, dynamic, Namedlist, AnnotatedString, contains_wildcard_constraints, update_wildcard_constraints
 from snakemake.io import expand, InputFiles, OutputFiles, Wildcards, Params, Log, Resources
-from snakemake.io import apply_wildcards, is_flagged, not_iterable, is_callable
+from snakemake.io import apply_wildcards, is_flagged, not_iterable, is_callable, is_impure, LazyExpansion
 from snakemake.exceptions import RuleException, IOFileException, WildcardError, InputFunctionException, WorkflowError
 from snakemake.logging import logger
 from snakemake.common import Mode
@@ -61,6 +64,7 @@ class Rule:
             self.norun = False
             self.is_branched = False
             self.restart_times = 0
+            self._init_input_function_cache()
         elif len(args) == 1:
             other = args[0]
             self.name = other.name
@@ -95,6 +99,24 @@ class Rule:
             self.norun = other.norun
             self.is_branched = True
             self.restart_times = other.restart_times
+            self._init_input_function_cache()
+
+    def _init_input_function_cache(self):
+        # values of input, params and resources functions by function,
+        # wildcards and auxiliary parameters
+        self._input_function_cache = dict()
+        self._input_function_params = dict()
+        self.input_function_calls = 0
+        self.input_function_reuses = 0
+        self.input_function_time = 0.0
+        # input functions may be evaluated concurrently while building the
+        # DAG (see DAG.prefetch_input_functions)
+        self._input_function_lock = threading.Lock()
+
+    def clear_input_function_cache(self):
+        """Release the memoized values of input, params and resources
+        functions, e.g. once the DAG has been built."""
+        self._input_function_cache = dict()
 
     def dynamic_branch(self, wildcards, input=True):
         def get_io(rule):
@@ -346,6 +368,11 @@ class Rule:
             inoutput.append(item)
             if name:
                 inoutput.add_name(name)
+        elif isinstance(item, LazyExpansion) and not output:
+            # the files are only created when expanding the input of a job
+            inoutput.append(item)
+            if name:
+                inoutput.add_name(name)
         else:
             try:
                 start = len(inoutput)
@@ -417,17 +444,72 @@ class Rule:
                 lineno=self.lineno,
                 snakefile=self.snakefile)
 
-    def apply_input_function(self, func, wildcards, **aux_params):
+    def apply_input_function(self, func, wildcards, copy_result=False,
+                             **aux_params):
+        """
+        Call the given input, params or resources function. Unless the
+        function is marked as impure, its value is reused for calls with the
+        same wildcards and auxiliary parameters. With copy_result, each call
+        returns a copy of the reused value, such that modifying it (e.g. in
+        the run block of a job) does not affect other calls. Values that
+        cannot be copied are not reused in this case.
+        """
         if isinstance(func, _IOFile):
             func = func._file.callable
-        sig = inspect.signature(func)
-        _aux_params = {k: v for k, v in aux_params.items() if k in sig.parameters}
+        try:
+            parameters = self._input_function_params[func]
+        except KeyError:
+            parameters = self._input_function_params[func] = set(
+                inspect.signature(func).parameters)
+        _aux_params = {k: v for k, v in aux_params.items() if k in parameters}
+
+        key = None
+        if not is_impure(func):
+            key = input_function_key(func, wildcards, _aux_params)
+            if key in self._input_function_cache:
+                with self._input_function_lock:
+                    self.input_function_reuses += 1
+                value = self._input_function_cache[key][0]
+                return copy_value(value) if copy_result else value
+
+        start = time.time()
         try:
             value = func(Wildcards(fromdict=wildcards), **_aux_params)
         except (Exception, BaseException) as e:
             raise InputFunctionException(e, rule=self, wildcards=wildcards)
+        finally:
+            with self._input_function_lock:
+                self.input_function_calls += 1
+                self.input_function_time += time.time() - start
+        # iterators, e.g. returned by generator functions, can be consumed
+        # only once
+        if key is not None and not isinstance(value, Iterator):
+            cached = value
+            if copy_result:
+                try:
+                    cached = copy_value(value)
+                except (TypeError, copy.Error):
+                    return value
+            # the auxiliary parameters are kept such that the ids in the key
+            # are not reused by other objects
+            self._input_function_cache[key] = cached, _aux_params
         return value
 
+    def prefetch_input_functions(self, wildcards):
+        """
+        Evaluate the pure input functions of this rule for the given
+        wildcards, such that expand_input reuses their values. Errors are
+        ignored here, they are raised again when expanding the input.
+        """
+        for item in self.input:
+            if is_callable(item) and not is_impure(item._file.callable
+                                                   if isinstance(item, _IOFile)
+                                                   else item):
+                try:
+                    self.apply_input_function(item, wildcards)
+                except InputFunctionException:
+                    pass
+
     def _apply_wildcards(self, newitems, olditems, wildcards,
                          concretize=apply_wildcards,
                          check_return_type=True,
@@ -442,7 +524,13 @@ class Rule:
             is_unpack = is_flagged(item, "unpack")
 
             if is_callable(item):
-                item = self.apply_input_function(item, wildcards, **aux_params)
+                # values that are not flattened (i.e. params) are handed to
+                # the job as they are
+                item = self.apply_input_function(item, wildcards,
+                                                 copy_result=no_flattening,
+                                                 **aux_params)
+            elif isinstance(item, LazyExpansion):
+                item = map(IOFile, item)
 
             if is_unpack:
                 # Sanity checks before interpreting unpack()
@@ -738,3 +826,32 @@ class Ruleorder:
 
     def __iter__(self):
         return self.order.__iter__()
+
+
+def copy_value(value):
+    """Return a deep copy of the given value unless it is immutable."""
+    if isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return value
+    return copy.deepcopy(value)
+
+
+def input_function_key(func, wildcards, aux_params):
+    """
+    Return a key identifying a call of the given function with the given
+    wildcards and auxiliary parameters, or None if they are not hashable.
+    Input, output and resources are identified by the object, since copying
+    e.g. the input files of a large aggregation into the key is expensive.
+    """
+    def hashable(value):
+        if isinstance(value, Namedlist):
+            return id(value)
+        return value
+
+    key = (func, tuple(sorted(wildcards.items())) if wildcards else (),
+           tuple((name, hashable(value))
+                 for name, value in sorted(aux_params.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
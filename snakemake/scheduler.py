@@ -4,11 +4,14 @@ __email__ = "koester@jimmy.harvard.edu"
 __license__ = "MIT"
 
 import os, signal
+import time
 import threading
 import operator
+import heapq
+import queue
 from functools import partial
-from collections import defaultdict
-from itertools import chain, accumulate
+from collections import defaultdict, OrderedDict
+from itertools import chain, accumulate, count
 
 from snakemake.executors import DryrunExecutor, TouchExecutor, CPUExecutor
 from snakemake.executors import GenericClusterExecutor, SynchronousClusterExecutor, DRMAAExecutor
@@ -61,7 +64,8 @@ class JobScheduler:
         self.resources = dict(self.workflow.global_resources)
 
         use_threads = force_use_threads or (os.name != "posix") or cluster or cluster_sync or drmaa
-        self._open_jobs = threading.Event()
+        # events of finished, failed or submitted jobs, see _notify
+        self._events = queue.Queue()
         self._lock = threading.Lock()
 
         self._errors = False
@@ -144,7 +148,9 @@ class JobScheduler:
                                          latency_wait=latency_wait,
                                          benchmark_repeats=benchmark_repeats,
                                          cores=cores)
-        self._open_jobs.set()
+        self._ready = ReadyJobs(self.job_weight, self.job_reward)
+        self.update_open_jobs()
+        self._notify()
 
     @property
     def stats(self):
@@ -153,6 +159,16 @@ class JobScheduler:
         except AttributeError:
             raise TypeError("Executor does not support stats")
 
+    @property
+    def rule_runtimes(self):
+        """ Runtimes of the finished jobs of each rule (by name). """
+        runtimes = defaultdict(list)
+        for executor in (self._executor, getattr(self, "_local_executor", None)):
+            if hasattr(executor, "stats"):
+                for rule, times in executor.stats.rule_runtimes.items():
+                    runtimes[rule].extend(times)
+        return runtimes
+
     def candidate(self, job):
         """ Return whether a job is a candidate to be executed. """
         return (job not in self.running and job not in self.failed and
@@ -162,22 +178,29 @@ class JobScheduler:
     @property
     def open_jobs(self):
         """ Return open jobs. """
-        return filter(self.candidate, list(self.dag.ready_jobs))
+        return iter(self._ready)
+
+    def update_open_jobs(self, jobs=None):
+        """ Add the given newly ready jobs to the open jobs. Without jobs,
+        the open jobs are reinitialized from the ready jobs of the DAG. """
+        if jobs is None:
+            self._ready.clear()
+            jobs = self.dag.ready_jobs
+        for job in filter(self.candidate, list(jobs)):
+            self._ready.add(job)
 
     def schedule(self):
         """ Schedule jobs that are ready, maximizing cpu usage. """
         try:
             while True:
-                # work around so that the wait does not prevent keyboard interrupts
-                while not self._open_jobs.wait(1):
-                    pass
+                # consume the events before reading the state, such that
+                # events arriving in the meantime trigger another iteration
+                finished = self._wait_for_events()
 
                 # obtain needrun and running jobs in a thread-safe way
                 with self._lock:
-                    needrun = list(self.open_jobs)
+                    needrun = len(self._ready)
                     running = list(self.running)
-                # free the event
-                self._open_jobs.clear()
 
                 # handle errors
                 if not self.keepgoing and self._errors:
@@ -201,21 +224,20 @@ class JobScheduler:
 
                 logger.debug("Resources before job selection: {}".format(
                     self.resources))
-                logger.debug("Ready jobs ({}):\n\t".format(len(needrun)) +
-                             "\n\t".join(map(str, needrun)))
+                logger.debug("Ready jobs: {}".format(needrun))
 
                 # select jobs by solving knapsack problem
-                run = self.job_selector(needrun)
+                run = self.select_open_jobs()
                 logger.debug("Selected jobs ({}):\n\t".format(len(run)) +
                              "\n\t".join(map(str, run)))
-                # update running jobs
-                with self._lock:
-                    self.running.update(run)
                 logger.debug(
                     "Resources after job selection: {}".format(self.resources))
                 # actually run jobs
+                started = time.time()
                 for job in run:
                     self.run(job)
+                if run and finished is not None:
+                    self._report_latency(run[0], started - finished)
         except (KeyboardInterrupt, SystemExit):
             logger.info("Terminating processes on user request.")
             self._executor.cancel()
@@ -225,6 +247,38 @@ class JobScheduler:
                 job.cleanup()
             return False
 
+    def _notify(self, finished=None):
+        """ Wake up the scheduler, optionally with the time at which a
+        job has finished (or has been submitted). """
+        self._events.put(finished)
+
+    def _wait_for_events(self):
+        """
+        Block until at least one event has arrived and consume all pending
+        events. Return the time of the latest job finish among them, or
+        None.
+        """
+        events = []
+        # work around so that the wait does not prevent keyboard interrupts
+        while not events:
+            try:
+                events.append(self._events.get(timeout=1))
+            except queue.Empty:
+                pass
+        while True:
+            try:
+                events.append(self._events.get_nowait())
+            except queue.Empty:
+                break
+        finished = [t for t in events if t is not None]
+        return max(finished) if finished else None
+
+    def _report_latency(self, job, latency):
+        logger.debug("Started job {} {:.3f}s after the last job finished.".format(
+            self.dag.jobid(job), latency))
+        if not self.dryrun:
+            self.stats.report_scheduling_latency(latency)
+
     def run(self, job):
         self._executor.run(job,
                            callback=self._finish_callback,
@@ -255,21 +309,27 @@ class JobScheduler:
                  print_progress=False,
                  update_resources=True):
         """ Do stuff after job is finished. """
+        finished = time.time()
         with self._lock:
             if update_resources:
                 self.finished_jobs += 1
                 self.running.remove(job)
                 self._free_resources(job)
 
-            self.dag.finish(job, update_dynamic=update_dynamic)
+            newly_ready = self.dag.finish(job, update_dynamic=update_dynamic)
+            if update_dynamic and job.dynamic_output:
+                # the DAG has been updated, which can affect all open jobs
+                self.update_open_jobs()
+            else:
+                self.update_open_jobs(newly_ready)
 
             if print_progress:
                 logger.job_finished(jobid=self.dag.jobid(job))
                 self.progress()
 
-            if any(self.open_jobs) or not self.running:
+            if self._ready or not self.running:
                 # go on scheduling if open jobs are ready or no job is running
-                self._open_jobs.set()
+                self._notify(finished)
 
     def _error(self, job):
         """Clear jobs and stop the workflow.
@@ -281,7 +341,7 @@ class JobScheduler:
         with self._lock:
             self.running.remove(job)
             self._free_resources(job)
-            self._open_jobs.set()
+            self._notify()
             if job.restart_times > 0:
                 msg = (
                     ("Trying to restart job for rule {} with "
@@ -290,67 +350,28 @@ class JobScheduler:
                 logger.info(msg
                     )
                 job.restart_times -= 1
+                self._ready.add(job)
             else:
                 self._errors = True
                 self.failed.add(job)
                 if self.keepgoing:
                     logger.info("Job failed, going on with independent jobs.")
 
-    def job_selector(self, jobs):
+    def select_open_jobs(self):
         """
-        Using the greedy heuristic from
+        Select open jobs for execution and mark them as running, using the
+        greedy heuristic from
         "A Greedy Algorithm for the General Multidimensional Knapsack
 Problem", Akcay, Li, Xu, Annals of Operations Research, 2012
-
-        Args:
-            jobs (list):    list of jobs
+        (see ReadyJobs.select).
         """
         with self._lock:
-            # each job is an item with one copy (0-1 MDKP)
-            n = len(jobs)
-            x = [0] * n  # selected jobs
-            E = set(range(n))  # jobs still free to select
-            u = [1] * n
-            a = list(map(self.job_weight, jobs))  # resource usage of jobs
-            c = list(map(self.job_reward, jobs))  # job rewards
-
-            def calc_reward():
-                return [c_j * y_j for c_j, y_j in zip(c, y)]
-
             b = [self.resources[name]
-                 for name in self.workflow.global_resources
-                 ]  # resource capacities
-
-            while True:
-                # Step 2: compute effective capacities
-                y = [(min((min(u[j], b_i // a_j_i) if a_j_i > 0 else u[j])
-                          for b_i, a_j_i in zip(b, a[j]) if a_j_i) if j in E
-                      else 0) for j in range(n)]
-                if not any(y):
-                    break
-                y = [(max(1, int(self.greediness * y_j)) if y_j > 0 else 0)
-                     for y_j in y]
-
-                # Step 3: compute rewards on cumulative sums
-                reward = calc_reward()
-                j_sel = max(E, key=reward.__getitem__)  # argmax
-
-                # Step 4: batch increment
-                y_sel = y[j_sel]
-
-                # Step 5: update information
-                x[j_sel] += y_sel
-                b = [b_i - (a_j_i * y_sel) for b_i, a_j_i in zip(b, a[j_sel])]
-                u[j_sel] -= y_sel
-                if not u[j_sel] or self.greediness == 1:
-                    E.remove(j_sel)
-                if not E:
-                    break
-
-            solution = [job for job, sel in zip(jobs, x) if sel]
-            # update resources
+                 for name in self.workflow.global_resources]
+            solution = self._ready.select(b)
             for name, b_i in zip(self.workflow.global_resources, b):
                 self.resources[name] = b_i
+            self.running.update(solution)
             return solution
 
     def calc_resource(self, name, value):
@@ -367,12 +388,96 @@ Problem", Akcay, Li, Xu, Annals of Operations Research, 2012
                 for name in self.workflow.global_resources]
 
     def job_reward(self, job):
-        return (self.dag.priority(job), self.dag.temp_input_count(job), self.dag.downstream_size(job),
-                0 if self.touch else job.inputsize)
+        return (self.dag.priority(job), self.dag.critical_path(job), self.dag.temp_input_count(job),
+                self.dag.downstream_size(job), 0 if self.touch else job.inputsize)
 
     def dryrun_job_reward(self, job):
-        return (self.dag.priority(job), self.dag.temp_input_count(job), self.dag.downstream_size(job))
+        return (self.dag.priority(job), self.dag.critical_path(job), self.dag.temp_input_count(job),
+                self.dag.downstream_size(job))
 
     def progress(self):
         """ Display the progress. """
         logger.progress(done=self.finished_jobs, total=len(self.dag))
+
+
+class ReadyJobs:
+    """
+    Jobs that are ready to be scheduled.
+
+    Jobs are partitioned by their weight (i.e. resource usage). Each
+    partition is a heap ordered by decreasing reward, ties being broken by
+    insertion order. Weights and rewards of added jobs are determined on
+    the next selection, i.e. in the thread that schedules jobs. Removed
+    jobs are only marked in the heaps. Hence, adding or removing a job
+    takes O(log n) time, and selecting a job O(k log n) time for k
+    partitions. Jobs of the same weight, e.g. of the same rule, thus form
+    a single item of the knapsack heuristic.
+    """
+
+    def __init__(self, weight, reward):
+        self.weight = weight
+        self.reward = reward
+        self._partitions = dict()
+        self._entries = dict()
+        self._pending = OrderedDict()
+        self._counter = count()
+
+    def __len__(self):
+        return len(self._entries) + len(self._pending)
+
+    def __iter__(self):
+        return iter(list(chain(self._entries, self._pending)))
+
+    def __contains__(self, job):
+        return job in self._entries or job in self._pending
+
+    def add(self, job):
+        """Add the given job, or update its weight and reward."""
+        self.discard(job)
+        self._pending[job] = None
+
+    def discard(self, job):
+        """Remove the given job if present."""
+        self._pending.pop(job, None)
+        item = self._entries.pop(job, None)
+        if item is not None:
+            item[1][-1] = None
+
+    def clear(self):
+        self._partitions.clear()
+        self._entries.clear()
+        self._pending.clear()
+
+    def _push_pending(self):
+        for job in list(self._pending):
+            weight = tuple(self.weight(job))
+            entry = [tuple(-c for c in self.reward(job)), next(self._counter),
+                     job]
+            del self._pending[job]
+            self._entries[job] = (weight, entry)
+            heapq.heappush(self._partitions.setdefault(weight, []), entry)
+
+    def select(self, capacities):
+        """
+        Remove and return the jobs selected by the greedy heuristic, i.e.
+        repeatedly the job with the highest reward among those that fit
+        into the given capacities. The capacities are updated in place.
+        """
+        self._push_pending()
+        solution = []
+        while True:
+            best = None
+            for weight, heap in list(self._partitions.items()):
+                while heap and heap[0][-1] is None:
+                    heapq.heappop(heap)
+                if not heap:
+                    del self._partitions[weight]
+                elif ((best is None or heap[0] < best[0]) and
+                      all(a <= b for a, b in zip(weight, capacities))):
+                    best = heap
+            if best is None:
+                return solution
+            job = heapq.heappop(best)[-1]
+            weight, _ = self._entries.pop(job)
+            capacities[:] = [b - a for a, b in zip(weight, capacities)]
+            solution.append(job)
@@ -6,17 +6,22 @@ __license__ = "MIT"
 import time
 import csv
 import json
-from collections import defaultdict
+from bisect import bisect_left
+from collections import defaultdict, OrderedDict
 
 import snakemake.jobs
 
 fmt_time = time.ctime
 
+# upper bounds (in seconds) of the bins of the scheduling latency histogram
+LATENCY_BINS = (0.001, 0.01, 0.1, 1, 10)
+
 
 class Stats:
     def __init__(self):
         self.starttime = dict()
         self.endtime = dict()
+        self.scheduling_latencies = list()
 
     def report_job_start(self, job):
         self.starttime[job] = time.time()
@@ -24,6 +29,10 @@ class Stats:
     def report_job_end(self, job):
         self.endtime[job] = time.time()
 
+    def report_scheduling_latency(self, latency):
+        """ Report the time between a job finish and the next job start. """
+        self.scheduling_latencies.append(latency)
+
     @property
     def rule_stats(self):
         runtimes = defaultdict(list)
@@ -33,6 +42,14 @@ class Stats:
             yield (rule, sum(runtimes) / len(runtimes), min(runtimes),
                    max(runtimes))
 
+    @property
+    def rule_runtimes(self):
+        """ Runtimes of the finished jobs of each rule (by name). """
+        runtimes = defaultdict(list)
+        for job, t in self.endtime.items():
+            runtimes[job.rule.name].append(t - self.starttime[job])
+        return runtimes
+
     @property
     def file_stats(self):
         for job, t in self.starttime.items():
@@ -40,6 +57,15 @@ class Stats:
                 start, stop = t, self.endtime[job]
                 yield f, fmt_time(start), fmt_time(stop), stop - start, job
 
+    @property
+    def latency_histogram(self):
+        counts = [0] * (len(LATENCY_BINS) + 1)
+        for latency in self.scheduling_latencies:
+            counts[bisect_left(LATENCY_BINS, latency)] += 1
+        labels = ["<={}s".format(bound) for bound in LATENCY_BINS]
+        labels.append(">{}s".format(LATENCY_BINS[-1]))
+        return OrderedDict(zip(labels, counts))
+
     @property
     def overall_runtime(self):
         if self.starttime and self.endtime:
@@ -69,10 +95,18 @@ class Stats:
             for f, start, stop, duration, job in self.file_stats
         }
 
+        latencies = self.scheduling_latencies
+        scheduling_latency = {
+            "mean": sum(latencies) / len(latencies) if latencies else 0,
+            "max": max(latencies, default=0),
+            "histogram": self.latency_histogram
+        }
+
         with open(path, "w") as f:
             json.dump({
                 "total_runtime": self.overall_runtime,
                 "rules": rule_stats,
-                "files": file_stats
+                "files": file_stats,
+                "scheduling_latency": scheduling_latency
             }, f,
                       indent=4)
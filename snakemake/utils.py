@@ -9,14 +9,13 @@ import json
 import re
 import inspect
 import textwrap
-from itertools import chain
 from collections import Mapping
 import multiprocessing
 import string
 import shlex
 import sys
 
-from snakemake.io import regex, Namedlist, Wildcards
+from snakemake.io import glob_files, Namedlist, Wildcards
 from snakemake.logging import logger
 from snakemake.exceptions import WorkflowError
 import snakemake
@@ -46,28 +45,16 @@ def listfiles(pattern, restriction=None, omit_value=None):
         tuple: The next file matching the pattern, and the corresponding wildcards object
     """
     pattern = os.path.normpath(pattern)
-    first_wildcard = re.search("{[^{]", pattern)
-    if first_wildcard:
-        dirname = os.path.dirname(pattern[:first_wildcard.start()])
-        if not dirname:
-            dirname = "."
-    else:
-        dirname = os.path.dirname(pattern)
-    pattern = re.compile(regex(pattern))
-    for dirpath, dirnames, filenames in os.walk(dirname):
-        for f in chain(filenames, dirnames):
-            if dirpath != ".":
-                f = os.path.normpath(os.path.join(dirpath, f))
-            match = re.match(pattern, f)
-            if match:
-                wildcards = Namedlist(fromdict=match.groupdict())
-                if restriction is not None:
-                    invalid = any(omit_value not in v and v != wildcards[k]
-                                  for k, v in restriction.items())
-                    if not invalid:
-                        yield f, wildcards
-                else:
-                    yield f, wildcards
+    for match in glob_files(pattern):
+        f = match.string
+        wildcards = Namedlist(fromdict=match.groupdict())
+        if restriction is not None:
+            invalid = any(omit_value not in v and v != wildcards[k]
+                          for k, v in restriction.items())
+            if not invalid:
+                yield f, wildcards
+        else:
+            yield f, wildcards
 
 
 def makedirs(dirnames):
@@ -24,7 +24,7 @@ from snakemake.dag import DAG
 from snakemake.scheduler import JobScheduler
 from snakemake.parser import parse
 import snakemake.io
-from snakemake.io import protected, temp, temporary, ancient, expand, dynamic, glob_wildcards, flag, not_iterable, touch, unpack
+from snakemake.io import protected, temp, temporary, ancient, expand, lazy_expand, LazyExpansion, dynamic, glob_wildcards, flag, not_iterable, touch, unpack, impure
 from snakemake.persistence import Persistence
 from snakemake.utils import update_config
 from snakemake.script import script
@@ -109,7 +109,8 @@ class Workflow:
         return (
             file
             for rule in self.rules for file in chain(rule.input, rule.output)
-            if not callable(file) and not file.contains_wildcard()
+            if not callable(file) and not isinstance(file, LazyExpansion) and
+            not file.contains_wildcard()
         )
 
     def check(self):
@@ -228,7 +229,12 @@ class Workflow:
                 max_jobs_per_second=None,
                 greediness=1.0,
                 no_hooks=False,
-                force_use_threads=False):
+                force_use_threads=False,
+                cache_dag=False,
+                prefetch_threads=8,
+                input_function_threads=0,
+                critical_path=False,
+                max_dependency_depth=DAG.MAX_DEPENDENCY_DEPTH):
 
         self.global_resources = dict() if resources is None else resources
         self.global_resources["_cores"] = cores
@@ -307,7 +313,11 @@ class Workflow:
             force_incomplete=force_incomplete,
             ignore_incomplete=ignore_incomplete or printdag or printrulegraph,
             notemp=notemp,
-            keep_remote_local=keep_remote_local)
+            keep_remote_local=keep_remote_local,
+            cache_dag=cache_dag,
+            prefetch_threads=prefetch_threads,
+            input_function_threads=input_function_threads,
+            max_dependency_depth=max_dependency_depth)
 
         self.persistence = Persistence(
             nolock=nolock,
@@ -372,9 +382,16 @@ class Workflow:
                 logger.info("Executing main workflow.")
             # rescue globals
             self.globals.update(globals_backup)
+            # subworkflows have created files
+            snakemake.io.iocache.clear()
 
         dag.check_incomplete()
+        if critical_path:
+            dag.runtimes = self.persistence.runtimes(
+                rule.name for rule in dag.rules)
         dag.postprocess()
+        logger.debug("File metadata cache: {} hits, {} misses.".format(
+            snakemake.io.iocache.hits, snakemake.io.iocache.misses))
 
         if nodeps:
             missing_input = [f for job in dag.targetjobs for f in job.input
@@ -489,6 +506,11 @@ class Workflow:
 
         success = scheduler.schedule()
 
+        if not dryrun and not touch and self.mode == Mode.default:
+            # spawned Snakemake processes (e.g. cluster jobs) do not record
+            # runtimes, their jobs are recorded by the main process
+            self.persistence.record_runtimes(scheduler.rule_runtimes)
+
         if success:
             if dryrun:
                 if not quiet and len(dag):
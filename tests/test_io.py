@@ -1,4 +1,12 @@
-from snakemake.io import _wildcard_regex
+import os
+import re
+import pickle
+import tempfile
+
+from snakemake.io import _wildcard_regex, IOFile, iocache, temp, flag
+from snakemake.io import apply_wildcards, expand, lazy_expand, glob_wildcards
+from snakemake.io import PeriodicityDetector, Wildcards, InputFiles
+from snakemake.exceptions import WildcardError
 
 
 def test_wildcard_regex():
@@ -31,3 +39,158 @@ def test_wildcard_regex():
 
     # This used to be very slow with an older version of the regex
     assert matches('{w, long constraint without closing brace') == []
+
+
+def test_iocache():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        f = IOFile(os.path.join(tmpdir, "test.txt"))
+        iocache.clear()
+        assert not f.exists
+        open(f, "w").close()
+        # the cached metadata is used until it is invalidated
+        assert not f.exists
+        assert iocache.hits == 1 and iocache.misses == 1
+        f.touch_or_create()
+        assert f.exists
+        mtime = f.mtime
+        f.touch((mtime + 10, mtime + 10))
+        assert f.mtime == mtime + 10
+        f.remove()
+        assert not f.exists
+
+
+def test_iocache_prefetch():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        files = [IOFile(os.path.join(tmpdir, "{}.txt".format(i)))
+                 for i in range(2 * iocache.SCANDIR_MIN_FILES)]
+        for f in files[::2]:
+            open(f, "w").close()
+        os.symlink(files[0], os.path.join(tmpdir, "link"))
+        os.symlink(files[1], os.path.join(tmpdir, "broken"))
+        links = [IOFile(os.path.join(tmpdir, name))
+                 for name in ("link", "broken")]
+        iocache.clear()
+        assert iocache.prefetch(files + links, threads=4) == len(files) + 2
+        assert iocache.prefetch(files + links, threads=4) == 0
+        assert [f.exists for f in files] == [i % 2 == 0
+                                             for i in range(len(files))]
+        assert links[0].exists and not links[1].exists
+        assert links[1].mtime == os.lstat(links[1]).st_mtime
+        assert iocache.misses == 0
+
+
+def test_apply_wildcards_static():
+    f = IOFile(temp("data/all.txt"))
+    assert f.apply_wildcards({"sample": "a"}) is f
+    g = IOFile(temp("data/{sample}.txt"))
+    h = g.apply_wildcards({"sample": "a"})
+    assert h == "data/a.txt" and h.flags == g.flags
+
+
+def test_shared_flags():
+    f = IOFile(temp("{sample}.txt"))
+    a = f.apply_wildcards({"sample": "a"})
+    b = f.apply_wildcards({"sample": "b"})
+    assert a.flags is b.flags
+    # flags are copied on write
+    flag(a._file, "ancient")
+    assert a.flags == {"temp": True, "ancient": True}
+    assert b.flags == f.flags == {"temp": True}
+
+
+def test_apply_wildcards():
+    wildcards = {"x": "X", "y": 3}
+    assert apply_wildcards("a/{x}/{y,[0-9]+}.{x}.txt",
+                           wildcards) == "a/X/3.X.txt"
+    assert apply_wildcards("a/{x}/{z}", wildcards,
+                           keep_dynamic=True) == "a/X/{z}"
+    assert apply_wildcards("a/{x}/{z}", wildcards, fill_missing=True,
+                           dynamic_fill="__F__") == "a/X/__F__"
+    try:
+        apply_wildcards("a/{x}/{z}", wildcards)
+        assert False, "expected WildcardError"
+    except WildcardError:
+        pass
+
+
+def test_lazy_expand():
+    files = lazy_expand("{a}_{b}.txt", a=["x", "x_y"], b=["y_z", "z"])
+    assert list(files) == expand("{a}_{b}.txt", a=["x", "x_y"], b=["y_z", "z"])
+    assert len(files) == 4
+    assert "x_y_z.txt" in files and "x_y_y_z.txt" in files
+    assert "x_x.txt" not in files
+    files = lazy_expand("{a}/{b}.txt", zip, a=[1, 2], b=[3, 4, 5])
+    assert len(files) == 2
+    assert "1/3.txt" in files and "1/4.txt" not in files
+
+
+def test_glob_wildcards():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for f in ["a/x/1.txt", "a/x/y/2.txt", "b/3.txt", "b/3.log"]:
+            f = os.path.join(tmpdir, f)
+            os.makedirs(os.path.dirname(f), exist_ok=True)
+            open(f, "w").close()
+        os.symlink(os.path.join(tmpdir, "a"), os.path.join(tmpdir, "c"))
+        for threads in (1, 2):
+            iocache.clear()
+            # wildcards match slashes unless constrained
+            pattern = os.path.join(tmpdir, "{s}/{n}.txt")
+            wildcards = glob_wildcards(pattern, threads=threads)
+            assert sorted(zip(*wildcards)) == [("a/x", "1"), ("a/x/y", "2"),
+                                               ("b", "3")]
+            pattern = os.path.join(tmpdir, "{s,[^/]+}/x/{n}.txt")
+            wildcards = glob_wildcards(pattern, threads=threads)
+            # like os.walk, symlinks to directories are not followed
+            assert sorted(zip(*wildcards)) == [("a", "1"), ("a", "y/2")]
+            pattern = os.path.join(tmpdir, "{s,[^/]+}/{n,[^/]+}.txt")
+            assert glob_wildcards(pattern, threads=threads).n == ["3"]
+
+
+def test_periodicity_detector():
+    # the detector used to search for this regular expression
+    regex = re.compile("((?P<value>.+)(?P=value){1,2})$")
+    detector = PeriodicityDetector(min_repeat=2, max_repeat=3)
+    for value in ["", "a", "aa", "aaaa", "abab", "xababab", "xabababab",
+                  "abaaba", "aab", "ab\nabab", "abab\n", "a\n\n",
+                  "0123456789abcdef" * 4]:
+        m = regex.search(value)
+        expected = m.group("value") if m is not None else None
+        assert detector.is_periodic(value) == expected, value
+    assert PeriodicityDetector().is_periodic("x" + "ab" * 60) == "ab"
+
+
+def test_namedlist():
+    # names take precedence over list methods
+    wildcards = Wildcards(fromdict={"index": "i7", "count": "2"})
+    assert wildcards.index == "i7" and wildcards.count == "2"
+    assert "{wildcards.index}".format(wildcards=wildcards) == "i7"
+
+    files = InputFiles(["a", "b", "c", "d"])
+    files.set_name("reads", 1, end=3)
+    files.add_name("ref")
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        copy = pickle.loads(pickle.dumps(files, protocol=protocol))
+        assert type(copy) is InputFiles and copy == files
+        assert copy.reads == ["b", "c"] and copy.ref == "d"
+        assert list(copy.allitems()) == list(files.allitems())
+
+
+def test_namedlist_ranges():
+    files = InputFiles(["a", "b", "c", "d"])
+    files.set_name("ref", 0)
+    files.set_name("reads", 1, end=3)
+    # ranges are looked up on first access only
+    assert "reads" not in files.__dict__
+    assert files.reads == ["b", "c"] and files.reads is files.reads
+    assert files["reads"] is files.get("reads") is files.reads
+    assert dict(files.items()) == {"ref": "a", "reads": ["b", "c"]}
+
+    # expanding an item shifts the following names
+    files.insert_items(0, ["x", "y"])
+    assert files.ref == ["x", "y"] and files.reads == ["b", "c"]
+    assert list(files.get_names()) == [("ref", (0, 2)), ("reads", (2, 4))]
+
+    # a range may be named like a list method
+    files.set_name("index", 1, end=4)
+    assert files.index == ["y", "b", "c"]
+    assert files.get("missing") is None
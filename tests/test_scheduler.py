@@ -0,0 +1,160 @@
+import queue
+import random
+import threading
+from itertools import product
+
+from snakemake.scheduler import JobScheduler, ReadyJobs
+from snakemake.executors import ClusterExecutor
+from snakemake.stats import Stats
+
+
+class Job:
+    def __init__(self, weight, reward):
+        self.weight = weight
+        self.reward = reward
+
+
+class Workflow:
+    global_resources = {"_cores": 4, "_nodes": 3, "mem": 6}
+
+
+def scheduler():
+    scheduler = JobScheduler.__new__(JobScheduler)
+    scheduler.workflow = Workflow()
+    scheduler.resources = dict(Workflow.global_resources)
+    scheduler._lock = threading.Lock()
+    scheduler._events = queue.Queue()
+    scheduler.job_weight = lambda job: job.weight
+    scheduler.job_reward = lambda job: job.reward
+    return scheduler
+
+
+def greedy(jobs, capacities):
+    """
+    The greedy heuristic, selecting the fitting job with the highest reward
+    (the first one in case of ties) one at a time.
+    """
+    jobs = list(jobs)
+    selected = []
+    while True:
+        fitting = [job for job in jobs
+                   if all(a <= b for a, b in zip(job.weight, capacities))]
+        if not fitting:
+            return selected, capacities
+        job = max(fitting, key=lambda job: job.reward)
+        jobs.remove(job)
+        selected.append(job)
+        capacities = [b - a for a, b in zip(job.weight, capacities)]
+
+
+def test_ready_jobs_select():
+    weights = [[1, 1, 0], [2, 1, 3], [1, 1, 4], [4, 1, 0]]
+    rewards = [(0, 1), (1, 0), (1, 1), (0, 0)]
+    jobs = [Job(weight, reward)
+            for weight, reward in product(weights, rewards)]
+
+    ready = ReadyJobs(lambda job: job.weight, lambda job: job.reward)
+    for job in jobs:
+        ready.add(job)
+    ready.discard(jobs[0])
+    ready.add(jobs[0])
+    assert len(ready) == len(jobs)
+    capacities = list(Workflow.global_resources.values())
+    selected = ready.select(capacities)
+
+    # the re-added job comes last among jobs of the same reward
+    expected, remaining = greedy(jobs[1:] + jobs[:1],
+                                 Workflow.global_resources.values())
+    assert selected == expected
+    assert capacities == remaining
+    assert len(ready) == len(jobs) - len(selected)
+    assert not set(selected) & set(ready)
+    # further jobs do not fit
+    assert ready.select(capacities) == []
+
+
+def test_ready_jobs_batches():
+    # many jobs of the same weight, interleaved rewards
+    rng = random.Random(0)
+    weights = [[1, 1, 0], [2, 1, 3], [1, 0, 1], [0, 0, 2]]
+    for _ in range(20):
+        jobs = [Job(rng.choice(weights), (rng.randint(0, 3), ))
+                for _ in range(40)]
+        capacities = [rng.randint(0, 30), rng.randint(0, 30),
+                      rng.randint(0, 60)]
+
+        ready = ReadyJobs(lambda job: job.weight, lambda job: job.reward)
+        for job in jobs:
+            ready.add(job)
+        for job in jobs[::7]:
+            ready.discard(job)
+        expected, remaining = greedy(
+            [job for job in jobs if job in ready], capacities)
+        assert ready.select(capacities) == expected
+        assert capacities == remaining
+
+
+def test_select_open_jobs():
+    s = scheduler()
+    s.running = set()
+    s._ready = ReadyJobs(s.job_weight, s.job_reward)
+    jobs = [Job([2, 1, 3], (1, )), Job([1, 1, 0], (0, )),
+            Job([2, 1, 0], (2, ))]
+    for job in jobs:
+        s._ready.add(job)
+    assert s.select_open_jobs() == [jobs[2], jobs[0]]
+    assert s.running == {jobs[2], jobs[0]}
+    assert s.resources == {"_cores": 0, "_nodes": 1, "mem": 3}
+
+
+def test_wait_for_events():
+    s = scheduler()
+    s._notify()
+    s._notify(2.0)
+    s._notify(1.0)
+    # all pending events are consumed at once
+    assert s._wait_for_events() == 2.0
+    assert s._events.empty()
+    s._notify()
+    assert s._wait_for_events() is None
+
+
+def test_latency_histogram():
+    stats = Stats()
+    for latency in [0.0005, 0.002, 0.003, 0.5, 20]:
+        stats.report_scheduling_latency(latency)
+    assert list(stats.latency_histogram.values()) == [1, 2, 0, 1, 0, 1]
+    assert list(stats.latency_histogram)[-1] == ">10s"
+
+
+def test_cluster_status_checks():
+    executor = ClusterExecutor.__new__(ClusterExecutor)
+    executor.lock = threading.Lock()
+    executor._wakeup = threading.Event()
+    executor.active_jobs = list()
+    executor._check_schedule = dict()
+    running, submitted = object(), object()
+    executor.add_active_job(running)
+    executor._check_schedule[id(running)] = [1, 0]
+    executor.add_active_job(submitted)
+
+    # only jobs that are due are checked
+    assert executor._due_jobs() == [running]
+    assert executor.active_jobs == [submitted]
+    executor.active_jobs.append(running)
+    assert executor._check_schedule[id(running)][0] == 1
+
+    # the interval of a submitted job is doubled with each check
+    intervals = []
+    for _ in range(5):
+        executor._check_schedule[id(submitted)][1] = 0
+        assert executor._due_jobs() == [submitted]
+        executor.active_jobs.append(submitted)
+        intervals.append(executor._check_schedule[id(submitted)][0])
+    assert intervals == [0.2, 0.4, 0.8, 1, 1]
+
+    # finished jobs are forgotten
+    executor.active_jobs.remove(running)
+    executor._wakeup.set()
+    executor._sleep()
+    assert list(executor._check_schedule) == [id(submitted)]
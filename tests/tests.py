@@ -8,13 +8,18 @@ import os
 from os.path import join
 from subprocess import call
 import tempfile
+import time
 import hashlib
 import urllib
-from shutil import rmtree, which
+from shutil import rmtree, which, copy
 from shlex import quote
 from nose.tools import nottest
 
 from snakemake import snakemake
+from snakemake.workflow import Workflow
+from snakemake.jobs import Job
+from snakemake.persistence import Persistence
+from snakemake.io import LazyExpansion
 
 
 if not which("snakemake"):
@@ -175,10 +180,18 @@ def test_dynamic():
     run(dpath("test_dynamic"))
 
 
+def test_dynamic_ref():
+    run(dpath("test_dynamic_ref"))
+
+
 def test_params():
     run(dpath("test_params"))
 
 
+def test_params_once():
+    run(dpath("test_params_once"))
+
+
 def test_same_wildcard():
     run(dpath("test_same_wildcard"))
 
@@ -347,6 +360,39 @@ def test_input_generator():
     run(dpath("test_input_generator"))
 
 
+def test_input_function_threads():
+    def execute(**params):
+        jobs = []
+
+        def log_handler(msg):
+            if msg["level"] == "job_info":
+                jobs.append((msg["jobid"], msg["name"], tuple(msg["input"]),
+                             tuple(msg["output"])))
+
+        with tempfile.TemporaryDirectory(prefix=".test",
+                                         dir=os.path.abspath(".")) as tmpdir:
+            copy(join(dpath("test_input_function_threads"), "Snakefile"),
+                 tmpdir)
+            assert snakemake(join(tmpdir, "Snakefile"), workdir=tmpdir,
+                             cores=3, log_handler=log_handler, **params)
+            with open(join(tmpdir, "calls.txt")) as f:
+                calls = [line.split("\t") for line in f.read().splitlines()]
+        return sorted(jobs), calls
+
+    jobs, calls = execute()
+    threaded_jobs, threaded_calls = execute(input_function_threads=4)
+    # the same DAG is built
+    assert threaded_jobs == jobs
+    # each function is called once per sample
+    assert threaded_calls[:-1] == calls[:-1]
+    assert len(calls) == 17
+    assert all(n == "1" for _, _, n in calls[:-1])
+    # the functions of the candidate jobs for the input of rule all are
+    # called concurrently
+    assert calls[-1] == ["max_active", "1"]
+    assert int(threaded_calls[-1][1]) > 1
+
+
 def test_symlink_time_handling():
     #See Snakefile for notes on why this fails on some systems
     if os.utime in os.supports_follow_symlinks:
@@ -481,10 +527,194 @@ def test_restartable_job_qsub_exit_1():
     run(dpath("test_restartable_job_qsub_exit_1"), cluster="./qsub",
         restart_times=1, shouldfail=False)
 
+def test_restartable_job_local():
+    """Test that a restarted job is scheduled again without a cluster"""
+    run(dpath("test_restartable_job_cmd_exit_1"), restart_times=0,
+        shouldfail=True)
+    run(dpath("test_restartable_job_cmd_exit_1"), restart_times=1)
+
+
 def test_threads():
     run(dpath("test_threads"), cores=20)
 
 
+def test_dag_cache():
+    run(dpath("test_dag_cache"), cache_dag=True)
+
+
+def test_dag_cache_reuse():
+    messages = []
+
+    def log_handler(msg):
+        if msg["level"] == "info":
+            messages.append(msg["msg"])
+
+    def dryrun(workdir):
+        del messages[:]
+        return snakemake(join(workdir, "Snakefile"), workdir=workdir,
+                         cache_dag=True, dryrun=True,
+                         log_handler=log_handler)
+
+    with tempfile.TemporaryDirectory(prefix=".test",
+                                     dir=os.path.abspath(".")) as tmpdir:
+        copy(join(dpath("test_dag_cache"), "Snakefile"), tmpdir)
+        assert dryrun(tmpdir)
+        assert not any("cached DAG" in msg for msg in messages)
+        assert dryrun(tmpdir)
+        assert "Loaded cached DAG of 5 jobs." in messages
+        # the absence of a.raw made rule from_raw fail for sample a, hence
+        # the DAG is inferred again, which now is ambiguous
+        open(join(tmpdir, "a.raw"), "w").close()
+        assert not dryrun(tmpdir)
+        assert any(msg.startswith("Cached DAG is outdated") and
+                   "file a.raw has been created" in msg
+                   for msg in messages)
+
+
+def test_memoized_params():
+    snakefile = join(dpath("test_memoized_params"), "Snakefile")
+    workflow = Workflow(snakefile=snakefile)
+    workflow.include(snakefile)
+    workflow.global_resources = {"_cores": 1, "_nodes": 1}
+    rule = workflow.get_rule("a")
+
+    # modify the params of a job like the run block does
+    job = Job(rule, None, wildcards_dict={"sample": "x"})
+    job.params.values["samples"].append("modified")
+    # another job of the same rule and wildcards reuses the value of the
+    # params function, but is not affected by the modification
+    job = Job(rule, None, wildcards_dict={"sample": "x"})
+    assert job.params.values == {"samples": ["x"]}
+    assert rule.input_function_calls == 1
+    assert rule.input_function_reuses == 1
+
+
+def test_lazy_input():
+    snakefile = join(dpath("test_lazy_input"), "Snakefile")
+    workflow = Workflow(snakefile=snakefile)
+    workflow.include(snakefile)
+    workflow.global_resources = {"_cores": 1, "_nodes": 1}
+    rule = workflow.get_rule("merge")
+    # the files are only created for the job
+    assert isinstance(rule.input.parts, LazyExpansion)
+    job = Job(rule, None, wildcards_dict={"name": "x"})
+    assert job.input.parts == ["x.0.part", "x.1.part", "x.2.part"]
+
+    run(dpath("test_lazy_input"))
+
+
+def test_input_tracking():
+    with tempfile.TemporaryDirectory(prefix=".test",
+                                     dir=os.path.abspath(".")) as tmpdir:
+        os.mkdir(join(tmpdir, "in"))
+        for i in range(1001):
+            open(join(tmpdir, "in", "{}.txt".format(i)), "w").close()
+        open(join(tmpdir, "sha256:0123"), "w").close()
+        assert snakemake(join(dpath("test_input_tracking"), "Snakefile"),
+                         workdir=tmpdir)
+
+        cwd = os.getcwd()
+        os.chdir(tmpdir)
+        try:
+            persistence = Persistence(nolock=True)
+            assert persistence.input("single.txt") == ["sha256:0123"]
+            assert persistence.input_digest("single.txt") is None
+            assert persistence.input("many.txt") is None
+            assert persistence.input_digest("many.txt").startswith("sha256:")
+        finally:
+            os.chdir(cwd)
+
+
+def test_candidate_pruning():
+    run(dpath("test_candidate_pruning"))
+
+
+def test_dag_errors():
+    def errors(kind):
+        messages = []
+
+        def log_handler(msg):
+            if msg["level"] == "error":
+                messages.append(str(msg["msg"]))
+
+        snakefile = join(dpath("test_dag_errors"), "Snakefile_" + kind)
+        with tempfile.TemporaryDirectory(prefix=".test",
+                                         dir=os.path.abspath(".")) as tmpdir:
+            assert not snakemake(snakefile, workdir=tmpdir, dryrun=True,
+                                 log_handler=log_handler)
+        return "\n".join(messages).replace(snakefile, "Snakefile")
+
+    assert errors("missing") == (
+        "MissingInputException in line 6 of Snakefile:\n"
+        "Missing input files for rule a:\n"
+        "result.raw")
+    assert errors("cyclic") == (
+        "CyclicGraphException in line 6 of Snakefile:\n"
+        "Cyclic dependency on rule a.")
+    assert errors("periodic") == (
+        "PeriodicWildcardError in line 6 of Snakefile:\n"
+        "The value .a in wildcard name is periodically repeated "
+        "(result{}). This would lead to an infinite recursion. To avoid "
+        "this, e.g. restrict the wildcards in this rule to certain "
+        "values.".format(".a" * 50))
+
+
+def test_infinite_dependency():
+    messages = []
+
+    def log_handler(msg):
+        if msg["level"] == "error":
+            messages.append(msg["msg"])
+
+    with tempfile.TemporaryDirectory(prefix=".test",
+                                     dir=os.path.abspath(".")) as tmpdir:
+        start = time.time()
+        assert not snakemake(
+            join(dpath("test_infinite_dependency"), "Snakefile"),
+            workdir=tmpdir, dryrun=True, max_dependency_depth=2000,
+            log_handler=log_handler)
+        assert time.time() - start < 60
+        assert any("exceeds a depth of 2000 jobs" in str(msg)
+                   for msg in messages)
+
+
+def test_large_dag():
+    # the benchmark workload at a reduced size
+    with tempfile.TemporaryDirectory(prefix=".test",
+                                     dir=os.path.abspath(".")) as tmpdir:
+        assert snakemake(join(dpath("test_large_dag"), "Snakefile"),
+                         workdir=tmpdir, cores=3,
+                         config={"chains": 5, "length": 4})
+        for chain in range(5):
+            for step in range(4):
+                assert os.path.exists(join(tmpdir, "chain{}".format(chain),
+                                           "step{}.txt".format(step)))
+
+
+def test_critical_path():
+    def execute(workdir, **kwargs):
+        order = join(workdir, "order.txt")
+        if os.path.exists(order):
+            os.remove(order)
+        assert snakemake(join(workdir, "Snakefile"), workdir=workdir,
+                         cores=1, **kwargs)
+        with open(order) as f:
+            return f.read().split()
+
+    with tempfile.TemporaryDirectory(prefix=".test",
+                                     dir=os.path.abspath(".")) as tmpdir:
+        copy(join(dpath("test_critical_path"), "Snakefile"), tmpdir)
+        # the chains of short jobs have more downstream jobs
+        assert execute(tmpdir)[0] == "short1"
+        # the recorded runtimes reveal that the slow job is on the critical
+        # path
+        assert execute(tmpdir, forceall=True, critical_path=True)[0] == "slow"
+
+
+def test_deep_dag():
+    run(dpath("test_deep_dag"))
+
+
 if __name__ == '__main__':
     import nose
     nose.run(defaultTest=__name__)